@@ -0,0 +1,296 @@
+""" Batch generation of explore playlists for many source playlists
+
+    The jobs of a manifest run concurrently in one process, through a single
+    Spotify client: they share its connection pools, its catalog cache and
+    one rate budget, and an artist found in several source playlists is
+    crawled only once. A summary of every job is written at the end.
+
+    Manifest format (JSON)::
+
+        {
+            "jobs": [
+                {
+                    "source_playlist_id": "37i9dQZF1DXcBWIGoYBM5M",
+                    "songs_per_artist": 10,
+                    "output_name": "Explore - Today's Top Hits",
+                    "include_followed_artists": false,
+                    "public": false,
+                    "incremental": false,
+                    "sync": false,
+                    "stream_artists": false,
+                    "prune_slack": null,
+                    "prune_audit_every": 0
+                },
+                ...
+            ]
+        }
+
+    Only `source_playlist_id` is required, `output_playlist_id` may be given
+    instead of `output_name` to fill an existing playlist. The albums seen
+    for the artists of a job are recorded in `releases_file` (by default
+    `<output playlist id>_releases.json` when `output_playlist_id` is
+    given), which `incremental` jobs use to only add new releases. `sync`
+    jobs only write the differences with their `output_playlist_id`, and
+    `stream_artists` jobs explore their artists in playlist order, starting
+    before the source playlist is fully read. With `prune_slack`, a job
+    only looks up the popularity of the songs of its artists' most popular
+    albums (see RunConfig), and its summary reports the requests saved.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import spotipy
+from spotipy.oauth2 import SpotifyOAuth
+
+from generate_explore_playlist_remastered import (
+    ArtistSongsCache,
+    PlaylistGenerator,
+    ReleaseIndex,
+    RunConfig,
+    SOURCE_CACHE_FILE,
+    SourcePlaylistCache,
+)
+
+DEFAULT_CONCURRENCY = 4
+# Requests per second shared by all the jobs, Spotify's limit is computed
+# over a rolling 30 seconds window
+DEFAULT_RATE = 5
+
+
+class Job:
+    def __init__(
+        self,
+        source_playlist_id: str,
+        songs_per_artist: int = 10,
+        output_name: str = None,
+        output_playlist_id: str = None,
+        include_followed_artists: bool = False,
+        public: bool = False,
+        incremental: bool = False,
+        releases_file: str = None,
+        sync: bool = False,
+        stream_artists: bool = False,
+        prune_slack: int = None,
+        prune_audit_every: int = 0,
+    ):
+        self.source_playlist_id = source_playlist_id
+        self.songs_per_artist = songs_per_artist
+        self.output_name = output_name
+        self.output_playlist_id = output_playlist_id
+        self.include_followed_artists = include_followed_artists
+        self.public = public
+        self.incremental = incremental
+        self.sync = sync
+        self.stream_artists = stream_artists
+        self.prune_slack = prune_slack
+        self.prune_audit_every = prune_audit_every
+        self.releases_file = releases_file
+        if releases_file is None and output_playlist_id is not None:
+            self.releases_file = f"{output_playlist_id}_releases.json"
+
+    @property
+    def name(self):
+        return self.output_name or self.output_playlist_id or self.source_playlist_id
+
+    def run_config(self):
+        output_name = self.output_name
+        if output_name is None and self.output_playlist_id is None:
+            output_name = f"Explore {self.source_playlist_id}"
+        return RunConfig(
+            source_playlist_id=self.source_playlist_id,
+            songs_per_artist=self.songs_per_artist,
+            output_playlist_name=output_name,
+            output_playlist_id=self.output_playlist_id,
+            include_followed_artists=self.include_followed_artists,
+            public=self.public,
+            release_index=(
+                ReleaseIndex(self.releases_file) if self.releases_file else None
+            ),
+            incremental=self.incremental,
+            sync=self.sync,
+            stream_artists=self.stream_artists,
+            prune_slack=self.prune_slack,
+            prune_audit_every=self.prune_audit_every,
+        )
+
+
+def load_manifest(path):
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    jobs = []
+    for i, job in enumerate(manifest["jobs"]):
+        if "source_playlist_id" not in job:
+            raise ValueError(f"Job {i} of {path} has no source_playlist_id")
+        jobs.append(Job(**job))
+    return jobs
+
+
+class BatchRunner:
+    """
+    Runs jobs concurrently, every job with its own PlaylistGenerator built
+    on the shared client and artist cache.
+    """
+
+    def __init__(
+        self, spotify_client, concurrency=DEFAULT_CONCURRENCY, source_cache=None
+    ):
+        self.sp = spotify_client
+        self.concurrency = concurrency
+        self.artist_cache = ArtistSongsCache()
+        self.source_cache = source_cache
+        self._print_lock = threading.Lock()
+
+    def log(self, message):
+        with self._print_lock:
+            print(message)
+
+    def run_job(self, job):
+        summary = {
+            "name": job.name,
+            "source_playlist_id": job.source_playlist_id,
+            "songs_per_artist": job.songs_per_artist,
+            "status": "failed",
+        }
+        started = time.monotonic()
+        self.log(f"[{job.name}] started")
+        generator = PlaylistGenerator(
+            None,
+            None,
+            None,
+            spotify_client=self.sp,
+            artist_cache=self.artist_cache,
+            source_cache=self.source_cache,
+        )
+        try:
+            result = generator.run(job.run_config())
+        except Exception as e:
+            summary["error"] = f"{type(e).__name__}: {e}"
+            self.log(f"[{job.name}] failed: {summary['error']}")
+        else:
+            summary["status"] = "done"
+            summary["output_playlist_id"] = result.output_playlist_id
+            summary["artists"] = result.artists_count
+            summary["songs"] = len(result.songs)
+            if result.sync_stats is not None:
+                summary["sync"] = result.sync_stats
+            if result.pruning_stats is not None:
+                summary["pruning"] = result.pruning_stats
+            summary["catalog"] = result.catalog_stats
+            self.log(
+                f"[{job.name}] {len(result.songs)} songs from "
+                f"{result.artists_count} artists"
+            )
+        summary["duration"] = round(time.monotonic() - started, 3)
+        return summary
+
+    def run(self, jobs):
+        """ Runs every job and returns their summaries, in manifest order """
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix="explore-job"
+        ) as executor:
+            return list(executor.map(self.run_job, jobs))
+
+    def stats(self):
+        stats = {
+            "artist_cache_hits": self.artist_cache.hits,
+            "artist_cache_misses": self.artist_cache.misses,
+        }
+        if self.source_cache is not None:
+            stats["source_cache_hits"] = self.source_cache.hits
+            stats["source_cache_misses"] = self.source_cache.misses
+        if self.sp.catalog_cache is not None:
+            stats["catalog_cache_hits"] = self.sp.catalog_cache.hits
+            stats["catalog_cache_misses"] = self.sp.catalog_cache.misses
+        if self.sp.rate_limiter is not None:
+            stats["rate_limiter_wait"] = round(self.sp.rate_limiter.waited, 3)
+        return stats
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate the explore playlists listed in a job manifest"
+    )
+    parser.add_argument("manifest", help="JSON job manifest")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"number of jobs run at once (default: {DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_RATE,
+        help="requests per second allowed for all the jobs together "
+        f"(default: {DEFAULT_RATE})",
+    )
+    parser.add_argument(
+        "--sources",
+        default=SOURCE_CACHE_FILE,
+        help="artists of the source playlists by snapshot_id, reused while a "
+        f"playlist doesn't change (default: {SOURCE_CACHE_FILE})",
+    )
+    parser.add_argument(
+        "--summary",
+        help="file the job summaries are written to "
+        "(default: <manifest>_summary.json)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    load_dotenv()
+    jobs = load_manifest(args.manifest)
+
+    sp = spotipy.Spotify(
+        auth_manager=SpotifyOAuth(
+            scope=PlaylistGenerator.SPOTIFY_API_SCOPE_NEEDED,
+            client_id=os.getenv("SPOTIPY_CLIENT_ID"),
+            client_secret=os.getenv("SPOTIPY_CLIENT_SECRET"),
+            redirect_uri=os.getenv("SPOTIPY_REDIRECT_URI"),
+            background_refresh=True,
+        ),
+        session_registry=spotipy.SessionRegistry(pool_maxsize=args.concurrency),
+        catalog_cache=spotipy.CatalogCache(),
+        rate_limiter=spotipy.RateLimiter(args.rate),
+    )
+
+    started_at = datetime.datetime.now()
+    runner = BatchRunner(
+        sp,
+        concurrency=args.concurrency,
+        source_cache=SourcePlaylistCache(args.sources),
+    )
+    summaries = runner.run(jobs)
+
+    summary_path = args.summary
+    if summary_path is None:
+        summary_path = f"{os.path.splitext(args.manifest)[0]}_summary.json"
+    with open(summary_path, "w") as f:
+        json.dump(
+            {
+                "started_at": str(started_at),
+                "finished_at": str(datetime.datetime.now()),
+                "jobs": summaries,
+                "stats": runner.stats(),
+            },
+            f,
+            indent=4,
+        )
+
+    failed = sum(1 for summary in summaries if summary["status"] != "done")
+    print(f"{len(jobs) - failed}/{len(jobs)} jobs done, summary written to {summary_path}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
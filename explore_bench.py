@@ -0,0 +1,91 @@
+""" Benchmark of the selection of the songs kept per artist
+
+    Compares select_songs with the previous selection (sorting the whole
+    discography by popularity, removing duplicate names, then slicing) on
+    synthetic discographies, after checking that both select the same songs.
+
+    Usage: python explore_bench.py [--tracks 2000] [--keep 20] [--runs 5]
+"""
+
+import argparse
+import random
+import sys
+import timeit
+
+from generate_explore_playlist_remastered import remove_duplicate_songs, select_songs
+
+
+def make_discography(tracks, rng):
+    """ Top 10 songs and `tracks` album tracks, a third of their names
+        appearing several times (singles, compilations, ...)
+    """
+    names = [f"song {i}" for i in range(max(1, tracks * 2 // 3))]
+    songs = [
+        {
+            "id": f"t{i}",
+            "uri": f"spotify:track:t{i}",
+            "name": rng.choice(names),
+            "popularity": rng.randint(0, 100),
+        }
+        for i in range(tracks)
+    ]
+    top_songs = sorted(rng.sample(songs, min(10, tracks)), key=lambda x: -x["popularity"])
+    return top_songs, songs
+
+
+def sort_and_dedup(top_songs, ranked_songs, count):
+    """ The selection select_songs replaces """
+    ranked_songs = sorted(ranked_songs, key=lambda x: x["popularity"], reverse=True)
+    return remove_duplicate_songs(top_songs + ranked_songs)[:count]
+
+
+def check(rng, cases=500):
+    for _ in range(cases):
+        top_songs, ranked_songs = make_discography(rng.randint(0, 300), rng)
+        count = rng.randint(1, 60)
+        expected = sort_and_dedup(top_songs, ranked_songs, count)
+        if select_songs(top_songs, ranked_songs, count) != expected:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--tracks", type=int, default=2000, help="tracks per artist (default: 2000)"
+    )
+    parser.add_argument(
+        "--keep", type=int, default=20, help="songs kept per artist (default: 20)"
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="timed runs of each selection (default: 5)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    if not check(rng):
+        print("select_songs doesn't select the same songs as the sort and dedup")
+        return 1
+
+    top_songs, ranked_songs = make_discography(args.tracks, rng)
+    results = {}
+    for name, select in (("sort + dedup", sort_and_dedup), ("select_songs", select_songs)):
+        seconds = min(
+            timeit.repeat(
+                lambda: select(top_songs, ranked_songs, args.keep),
+                number=1,
+                repeat=args.runs,
+            )
+        )
+        results[name] = seconds
+        print(f"{name}: {seconds * 1000:.2f} ms")
+    print(
+        f"{args.tracks} tracks, {args.keep} kept: "
+        f"{results['sort + dedup'] / results['select_songs']:.1f}x faster"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,237 @@
+""" Prometheus-style metrics for long-running generator jobs
+
+    Aggregates the `RequestEvent`s emitted by `spotipy.Spotify` into request
+    counters and latency histograms per endpoint template, and keeps a few
+    generator gauges. The metrics are rendered in the Prometheus text
+    exposition format, either served over HTTP or written to a file.
+"""
+
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+API_PREFIX = "/v1/"
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Path segments following one of these are object IDs, and get replaced by
+# `{id}` so that every artist/album/... shares the same endpoint template.
+ID_COLLECTIONS = frozenset([
+    "albums",
+    "artists",
+    "audio-analysis",
+    "audio-features",
+    "audiobooks",
+    "categories",
+    "chapters",
+    "episodes",
+    "playlists",
+    "shows",
+    "tracks",
+    "users",
+])
+SUB_RESOURCES = frozenset(["contains"])
+
+_label_escape = re.compile(r'(["\\\n])')
+
+
+def endpoint_template(url):
+    """ Turns a request URL into a low-cardinality endpoint template
+
+        e.g. https://api.spotify.com/v1/artists/0OdUWJ0sBjDrqHygGUXeCF/albums?limit=20
+        becomes artists/{id}/albums
+    """
+    path = urlparse(url).path
+    if path.startswith(API_PREFIX):
+        path = path[len(API_PREFIX):]
+    segments = [segment for segment in path.split("/") if segment]
+    for i in range(1, len(segments)):
+        if segments[i - 1] in ID_COLLECTIONS and segments[i] not in SUB_RESOURCES:
+            segments[i] = "{id}"
+    return "/".join(segments)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    formatted = ",".join(
+        '{}="{}"'.format(key, _label_escape.sub(r"\\\1", str(value)))
+        for key, value in labels
+    )
+    return "{" + formatted + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    """
+    Thread-safe registry of the counters, histograms and gauges of a run.
+
+    Register `observe_request` as a request listener of the Spotify client:
+
+        metrics = Metrics()
+        sp = spotipy.Spotify(auth_manager=..., request_listeners=[metrics.observe_request])
+        metrics.serve(9464)
+    """
+
+    REQUESTS = "spotify_requests_total"
+    RATE_LIMITED = "spotify_rate_limited_total"
+    LATENCY = "spotify_request_duration_seconds"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._help = {
+            self.REQUESTS: "Requests sent to the Spotify Web API.",
+            self.RATE_LIMITED: "Requests rejected with a 429 status code.",
+            self.LATENCY: "Latency of the requests sent to the Spotify Web API.",
+        }
+
+    def observe_request(self, event):
+        """ Request listener aggregating a `spotipy.client.RequestEvent` """
+        endpoint = endpoint_template(event.url)
+        status = event.status if event.status is not None else "error"
+        with self._lock:
+            key = (self.REQUESTS, (("endpoint", endpoint),
+                                   ("method", event.method),
+                                   ("status", status)))
+            self._counters[key] = self._counters.get(key, 0) + 1
+            if event.status == 429:
+                key = (self.RATE_LIMITED, (("endpoint", endpoint),))
+                self._counters[key] = self._counters.get(key, 0) + 1
+            key = (self.LATENCY, (("endpoint", endpoint),))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(event.duration)
+
+    def inc_counter(self, name, value=1, help=None, **labels):
+        with self._lock:
+            if help:
+                self._help[name] = help
+            key = (name, tuple(sorted(labels.items())))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, help=None, **labels):
+        with self._lock:
+            if help:
+                self._help[name] = help
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def inc_gauge(self, name, value=1, **labels):
+        with self._lock:
+            key = (name, tuple(sorted(labels.items())))
+            self._gauges[key] = self._gauges.get(key, 0) + value
+
+    def render(self):
+        """ Returns every metric in the Prometheus text exposition format """
+        lines = []
+        with self._lock:
+            self._render_simple(lines, self._counters, "counter")
+            self._render_simple(lines, self._gauges, "gauge")
+            described = set()
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                if name not in described:
+                    described.add(name)
+                    self._describe(lines, name, "histogram")
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    bucket_labels = labels + (("le", _format_value(bound)),)
+                    lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+                inf_labels = labels + (("le", "+Inf"),)
+                lines.append(f"{name}_bucket{_format_labels(inf_labels)} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def _render_simple(self, lines, values, metric_type):
+        described = set()
+        for (name, labels), value in sorted(values.items(), key=lambda item: str(item[0])):
+            if name not in described:
+                described.add(name)
+                self._describe(lines, name, metric_type)
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    def _describe(self, lines, name, metric_type):
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+    def write_to_file(self, path):
+        """ Atomically replaces `path` with the current metrics """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def write_periodically(self, path, interval=15):
+        """ Writes the metrics to `path` every `interval` seconds from a
+            daemon thread, e.g. for the node_exporter textfile collector.
+
+            Returns an Event which stops the writer once set.
+        """
+        stop_event = threading.Event()
+
+        def writer():
+            while not stop_event.wait(interval):
+                self._safe_write(path)
+
+        threading.Thread(target=writer, daemon=True).start()
+        return stop_event
+
+    def _safe_write(self, path):
+        try:
+            self.write_to_file(path)
+        except OSError as e:
+            print(f"Couldn't write metrics to {path}: {e}")
+
+    def serve(self, port, host="127.0.0.1"):
+        """ Serves the metrics on http://host:port/metrics from a daemon
+            thread and returns the server (call `shutdown()` to stop it)
+        """
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if urlparse(self.path).path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                return
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
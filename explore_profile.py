@@ -0,0 +1,129 @@
+""" Built-in profiling of generator runs (cProfile + tracemalloc)
+
+    The run is split in stages: at every stage boundary a tracemalloc
+    snapshot is taken and the peak memory of the stage is recorded. When
+    the profiler is stopped, the cProfile data is dumped as `<prefix>.pstats`
+    and a text report is written to `<prefix>.txt`.
+"""
+
+import cProfile
+import io
+import pstats
+import time
+import tracemalloc
+
+TOP_FUNCTIONS = 30
+TOP_ALLOCATIONS = 15
+TOP_ALLOCATIONS_PER_STAGE = 5
+
+
+def _format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.started_at = time.perf_counter()
+        self.duration = None
+        self.peak_memory = None
+        self.allocations = []
+
+
+def _take_snapshot():
+    snapshot = tracemalloc.take_snapshot()
+    return snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+
+class Profiler:
+    """
+        profiler = Profiler("explore_profile")
+        profiler.start("setup")
+        ...
+        profiler.stage("crawl")
+        ...
+        profiler.stop()
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.stages = []
+        self._profile = cProfile.Profile()
+        self._snapshot = None
+        self._running = False
+
+    @property
+    def pstats_path(self):
+        return f"{self.prefix}.pstats"
+
+    @property
+    def report_path(self):
+        return f"{self.prefix}.txt"
+
+    def start(self, stage_name="start"):
+        tracemalloc.start()
+        self._snapshot = _take_snapshot()
+        tracemalloc.reset_peak()
+        self.stages.append(Stage(stage_name))
+        self._running = True
+        self._profile.enable()
+
+    def stage(self, name):
+        """ Closes the current stage and opens a new one named `name` """
+        if not self._running:
+            return
+        self._profile.disable()
+        self._close_stage()
+        self.stages.append(Stage(name))
+        self._profile.enable()
+
+    def _close_stage(self):
+        stage = self.stages[-1]
+        stage.duration = time.perf_counter() - stage.started_at
+        _, stage.peak_memory = tracemalloc.get_traced_memory()
+        snapshot = _take_snapshot()
+        stage.allocations = snapshot.compare_to(self._snapshot, "lineno")[
+            :TOP_ALLOCATIONS_PER_STAGE
+        ]
+        self._snapshot = snapshot
+        # Taking a snapshot allocates a lot, don't account it to the next stage
+        tracemalloc.reset_peak()
+
+    def stop(self):
+        """ Stops profiling and writes the .pstats file and the report """
+        if not self._running:
+            return
+        self._profile.disable()
+        self._running = False
+        self._close_stage()
+        tracemalloc.stop()
+
+        self._profile.dump_stats(self.pstats_path)
+        with open(self.report_path, "w") as f:
+            f.write(self.report())
+
+    def report(self):
+        out = io.StringIO()
+
+        out.write("=== Stages ===\n")
+        for stage in self.stages:
+            out.write(
+                f"{stage.name:<24} {stage.duration:>10.3f} s"
+                f"   peak memory {_format_size(stage.peak_memory)}\n"
+            )
+            for stat in stage.allocations:
+                out.write(f"    {stat}\n")
+
+        out.write(f"\n=== Top {TOP_ALLOCATIONS} allocation sites at the end of the run ===\n")
+        for stat in self._snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            out.write(f"{stat}\n")
+
+        out.write(f"\n=== Top {TOP_FUNCTIONS} functions by cumulative time ===\n")
+        stats = pstats.Stats(self._profile, stream=out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+
+        return out.getvalue()
@@ -0,0 +1,204 @@
+""" Check of the exact-mode requests reported by the pruned mode
+
+    Runs the exact mode (no prune_slack) and the pruned mode on the same
+    synthetic catalog, whose artists share some of their albums, and checks
+    that the exact-mode requests the pruned run reports in PruningStats
+    (exact_tracks_requests, exact_requests) are the ones the exact run sent,
+    and that the pruned requests it reports are the ones it sent.
+
+    Albums have at most 50 tracks, so that all their songs come with
+    albums(): beyond that the exact-mode requests are an upper bound.
+
+    Usage: python explore_prune_check.py [--runs 30] [--seed 0]
+"""
+
+import argparse
+import collections
+import random
+import sys
+
+from generate_explore_playlist_remastered import PlaylistGenerator, RunConfig
+
+
+class SyntheticSpotify:
+    """ In-memory stand-in of the endpoints a crawl uses, counting requests """
+
+    max_playlist_items_per_request = 100
+
+    def __init__(self, rng, artists, shared_albums):
+        self.requests = collections.Counter()
+        self.tracks_by_id = {}
+        self.albums_by_id = {}
+        self.artist_albums_ids = {}
+        for i in range(artists):
+            artist = {"id": f"artist{i}", "name": f"Artist {i}"}
+            albums_ids = []
+            for j in range(rng.randint(1, 12)):
+                album_type = rng.choice(("album", "album", "single"))
+                album_id = f"{artist['id']}-{album_type}{j}"
+                count = rng.randint(1, 50) if album_type == "album" else rng.randint(1, 3)
+                tracks = [
+                    {
+                        "id": f"{album_id}-{k}",
+                        "uri": f"spotify:track:{album_id}-{k}",
+                        # Repeated names, like the versions of a song
+                        "name": f"{artist['id']} song {rng.randint(0, 60)}",
+                        "artists": [artist],
+                        "popularity": rng.randint(0, 100),
+                    }
+                    for k in range(count)
+                ]
+                self.tracks_by_id.update((track["id"], track) for track in tracks)
+                self.albums_by_id[album_id] = {
+                    "id": album_id,
+                    "name": f"Album {album_id}",
+                    "album_type": album_type,
+                    "tracks": tracks,
+                }
+                albums_ids.append(album_id)
+            self.artist_albums_ids[artist["id"]] = albums_ids
+        # Collaborations: an artist also lists some albums of the next one
+        for i in range(artists):
+            next_albums = self.artist_albums_ids[f"artist{(i + 1) % artists}"]
+            self.artist_albums_ids[f"artist{i}"] += next_albums[:shared_albums]
+        self.artists = [
+            {"id": f"artist{i}", "name": f"Artist {i}"} for i in range(artists)
+        ]
+
+    @staticmethod
+    def _page(kind, items, offset, limit):
+        return {
+            "items": items[offset : offset + limit],
+            "total": len(items),
+            "next": (
+                (kind, items, offset + limit, limit)
+                if offset + limit < len(items)
+                else None
+            ),
+        }
+
+    @staticmethod
+    def _simplified(track):
+        return {key: value for key, value in track.items() if key != "popularity"}
+
+    def next(self, result):
+        # Counted by listing: the pages of the artists' albums aren't part
+        # of the crawl the pruning saves requests of
+        self.requests[f"next {result['next'][0]}"] += 1
+        return self._page(*result["next"])
+
+    def artist_top_tracks(self, artist_id, country="US"):
+        self.requests["artist_top_tracks"] += 1
+        tracks = [
+            track
+            for album_id in self.artist_albums_ids[artist_id]
+            for track in self.albums_by_id[album_id]["tracks"]
+        ]
+        return {"tracks": sorted(tracks, key=lambda x: -x["popularity"])[:10]}
+
+    def artist_albums(self, artist_id, include_groups=None, limit=20, offset=0):
+        self.requests["artist_albums"] += 1
+        albums = [
+            {key: value for key, value in album.items() if key != "tracks"}
+            for album in map(self.albums_by_id.get, self.artist_albums_ids[artist_id])
+            if album["album_type"] == include_groups
+        ]
+        return self._page("artist_albums", albums, offset, limit)
+
+    def albums(self, albums_ids):
+        self.requests["albums"] += 1
+        albums = []
+        for album_id in albums_ids:
+            album = self.albums_by_id[album_id]
+            tracks = [self._simplified(track) for track in album["tracks"]]
+            albums.append(
+                dict(
+                    album,
+                    popularity=max(track["popularity"] for track in album["tracks"]),
+                    tracks=self._page("album_tracks", tracks, 0, 50),
+                )
+            )
+        return {"albums": albums}
+
+    def album_tracks(self, album_id, limit=50, offset=0):
+        self.requests["album_tracks"] += 1
+        tracks = [self._simplified(t) for t in self.albums_by_id[album_id]["tracks"]]
+        return self._page("album_tracks", tracks, offset, limit)
+
+    def tracks(self, tracks_ids):
+        self.requests["tracks"] += 1
+        return {"tracks": [self.tracks_by_id[track_id] for track_id in tracks_ids]}
+
+    def playlist_add_items(self, playlist_id, items, position=None):
+        self.requests["playlist_add_items"] += 1
+        return {"snapshot_id": "snapshot"}
+
+
+def run(seed, artists, songs_per_artist, prune_slack):
+    """ Returns the requests of a run of the catalog built from `seed`,
+        and its pruning stats
+    """
+    rng = random.Random(seed)
+    sp = SyntheticSpotify(rng, artists, shared_albums=rng.randint(0, 4))
+    result = PlaylistGenerator(None, None, None, spotify_client=sp).run(
+        RunConfig(
+            source_playlist_id="source",
+            songs_per_artist=songs_per_artist,
+            output_playlist_id="output",
+            artists=sp.artists,
+            prune_slack=prune_slack,
+        )
+    )
+    return sp.requests, result.pruning_stats
+
+
+def check(seed, artists, songs_per_artist, prune_slack):
+    """ Returns the differences between the reported and the sent requests """
+    exact, _ = run(seed, artists, songs_per_artist, None)
+    pruned, stats = run(seed, artists, songs_per_artist, prune_slack)
+    sent = {
+        "exact_tracks_requests": exact["tracks"],
+        "exact_requests": exact["album_tracks"]
+        + exact["next album_tracks"]
+        + exact["tracks"],
+        "tracks_requests": pruned["tracks"],
+        "requests": pruned["albums"]
+        + pruned["album_tracks"]
+        + pruned["next album_tracks"]
+        + pruned["tracks"],
+    }
+    return [
+        f"{name}: reported {stats[name]}, sent {count}"
+        for name, count in sent.items()
+        if stats[name] != count
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--runs", type=int, default=30, help="catalogs checked (default: 30)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    failed = 0
+    for _ in range(args.runs):
+        seed = rng.randrange(2**32)
+        artists = rng.randint(2, 12)
+        songs_per_artist = rng.choice((15, 25, 40))
+        prune_slack = rng.choice((0, 5, 10))
+        errors = check(seed, artists, songs_per_artist, prune_slack)
+        if errors:
+            failed += 1
+            print(
+                f"seed {seed}, {artists} artists, {songs_per_artist} songs per "
+                f"artist, slack {prune_slack}: {'; '.join(errors)}"
+            )
+    print(f"{args.runs - failed}/{args.runs} runs report the requests sent")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
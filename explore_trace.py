@@ -0,0 +1,103 @@
+""" Chrome trace-event timeline of generator runs
+
+    Records complete ("X") events for pipeline stages and HTTP calls, one
+    lane per thread, and writes them in the trace-event JSON format which
+    can be opened in chrome://tracing or https://ui.perfetto.dev
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from explore_metrics import endpoint_template
+
+
+def _now_us():
+    return time.time() * 1e6
+
+
+class Tracer:
+    """
+    Thread-safe trace-event recorder.
+
+        tracer = Tracer("out.json")
+        sp = spotipy.Spotify(auth_manager=..., request_listeners=[tracer.observe_request])
+        with tracer.span("album listing", artist="Daft Punk"):
+            ...
+        tracer.write()
+    """
+
+    def __init__(self, path=None, process_name="generate-explore-playlist"):
+        self.path = path
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._events = [self._metadata("process_name", 0, process_name)]
+        self._named_threads = set()
+
+    def _metadata(self, name, tid, value):
+        return {
+            "name": name,
+            "ph": "M",
+            "pid": self.pid,
+            "tid": tid,
+            "args": {"name": value},
+        }
+
+    def _add(self, event):
+        thread = threading.current_thread()
+        event["pid"] = self.pid
+        event["tid"] = thread.ident
+        with self._lock:
+            if thread.ident not in self._named_threads:
+                self._named_threads.add(thread.ident)
+                self._events.append(self._metadata("thread_name", thread.ident, thread.name))
+            self._events.append(event)
+
+    def complete(self, name, start_us, duration_us, cat="stage", **args):
+        """ Records a span which already happened """
+        self._add({
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": start_us,
+            "dur": duration_us,
+            "args": args,
+        })
+
+    def instant(self, name, cat="stage", **args):
+        self._add({
+            "name": name,
+            "cat": cat,
+            "ph": "i",
+            "s": "t",
+            "ts": _now_us(),
+            "args": args,
+        })
+
+    @contextmanager
+    def span(self, name, cat="stage", **args):
+        start = _now_us()
+        try:
+            yield
+        finally:
+            self.complete(name, start, _now_us() - start, cat=cat, **args)
+
+    def observe_request(self, event):
+        """ Request listener recording a `spotipy.client.RequestEvent` """
+        self.complete(
+            f"{event.method} {endpoint_template(event.url)}",
+            event.start * 1e6,
+            event.duration * 1e6,
+            cat="http",
+            url=event.url,
+            status=event.status,
+        )
+
+    def write(self, path=None):
+        path = path or self.path
+        with self._lock:
+            events = list(self._events)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
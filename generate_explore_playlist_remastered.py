@@ -1,7 +1,14 @@
 import spotipy
 import os
 import json
+import queue
+import heapq
+import struct
+import argparse
+import contextlib
+from spotipy.exceptions import SpotifyPartialWriteException
 from spotipy.oauth2 import SpotifyOAuth
+from spotipy.playlist_sync import sync_playlist
 from dotenv import load_dotenv
 import time
 import signal
@@ -9,13 +16,1355 @@ import sys
 import datetime
 import threading
 
+MAX_RETRY_COUNT_RATE_LIMIT = 3
+SOURCE_CACHE_FILE = "explore_sources.json"
+
+# Set with set_tracer() to record the pipeline stages of every run
+tracer = None
+
+
+def set_tracer(new_tracer):
+    global tracer
+    tracer = new_tracer
+
+
+# State files start with this magic and a format version, followed by
+# length-prefixed UTF-8 fields (see ProgramState.STATE_FIELDS)
+STATE_MAGIC = b"EXPS"
+STATE_VERSION = 2
+STATE_HEADER = struct.Struct("<4sB")
+_LENGTH = struct.Struct("<I")
+_NONE_LENGTH = 0xFFFFFFFF
+
+
+def _pack_field(value):
+    if value is None:
+        return _LENGTH.pack(_NONE_LENGTH)
+    data = value.encode("utf-8")
+    return _LENGTH.pack(len(data)) + data
+
+
+def _unpack_fields(data, offset):
+    fields = []
+    while offset < len(data):
+        (length,) = _LENGTH.unpack_from(data, offset)
+        offset += _LENGTH.size
+        if length == _NONE_LENGTH:
+            fields.append(None)
+            continue
+        fields.append(bytes(data[offset : offset + length]).decode("utf-8"))
+        offset += length
+    return fields
+
+
+class ProgramState:
+    # Order of the fields in a state file, by format version
+    STATE_FIELDS = {
+        1: (
+            "last_artist_saved_id",
+            "last_song_saved_id",
+            "input_playlist_id",
+            "output_playlist_id",
+            "wanted_songs_per_artist",
+            "started_at",
+            "last_updated_at",
+            "artists_ids",
+        ),
+    }
+    STATE_FIELDS[2] = STATE_FIELDS[1] + ("artists_names", "last_artist_saved_index")
+
+    def __init__(self):
+        self.last_artist_saved_id = None
+        # Position of last_artist_saved_id in artists
+        self.last_artist_saved_index = None
+        self.last_song_saved_id = None
+        self.input_playlist_id = None
+        self.output_playlist_id = None
+        self.wanted_songs_per_artist = None
+        # Only the id and name of the artists, which is all the crawl uses
+        self.artists = None
+        self.started_at = None
+        self.last_updated_at = None
+        self.resumed = False
+        self.filename = None
+
+    @property
+    def artists_ids(self):
+        if self.artists is None:
+            return None
+        return [artist["id"] for artist in self.artists]
+
+    def set_artists(self, artists):
+        self.artists = [{"id": artist["id"], "name": artist["name"]} for artist in artists]
+
+    def set_last_artist_saved(self, index):
+        self.last_artist_saved_index = index
+        self.last_artist_saved_id = self.artists[index]["id"]
+
+    def save_state(self):
+        if (
+            self.started_at is None
+            or self.artists is None
+            or self.output_playlist_id is None
+            or self.wanted_songs_per_artist is None
+        ):
+            print("No state to save")
+            return
+
+        date_str = self.started_at.strftime("%Y-%m-%d_%H-%M-%S")
+        previous_filename = self.filename
+        if not self.resumed:
+            self.filename = f"{date_str}_{self.input_playlist_id}_state.bin"
+        elif self.filename.endswith("_state.json"):
+            # Migrated to the current format on its first save
+            self.filename = self.filename[: -len(".json")] + ".bin"
+
+        self._write(self.filename)
+        if previous_filename is not None and previous_filename != self.filename:
+            os.remove(previous_filename)
+
+    def _write(self, filename):
+        values = {
+            "last_artist_saved_id": self.last_artist_saved_id,
+            "last_song_saved_id": self.last_song_saved_id,
+            "input_playlist_id": self.input_playlist_id,
+            "output_playlist_id": self.output_playlist_id,
+            "wanted_songs_per_artist": str(self.wanted_songs_per_artist),
+            "started_at": self.started_at.isoformat(),
+            "last_updated_at": (
+                self.last_updated_at.isoformat()
+                if self.last_updated_at is not None
+                else None
+            ),
+            # IDs are base62, a newline can't be part of one
+            "artists_ids": "\n".join(artist["id"] for artist in self.artists),
+            # Names are only missing from states saved before they were kept
+            "artists_names": (
+                "\0".join(artist["name"] for artist in self.artists)
+                if all(artist["name"] is not None for artist in self.artists)
+                else None
+            ),
+            "last_artist_saved_index": (
+                str(self.last_artist_saved_index)
+                if self.last_artist_saved_index is not None
+                else None
+            ),
+        }
+        data = STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION) + b"".join(
+            _pack_field(values[name]) for name in self.STATE_FIELDS[STATE_VERSION]
+        )
+        # Written aside then renamed, an interrupted save can't corrupt the state
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, "wb") as f:
+            f.write(data)
+        os.replace(tmp_filename, filename)
+
+    def load_state_from_file(self, filename):
+        with open(filename, "rb") as f:
+            data = f.read()
+        if data.startswith(STATE_MAGIC):
+            state = self._read(data, filename)
+        else:
+            # State files written before the binary format
+            state = json.loads(data)
+        self.filename = filename
+        self.resumed = True
+        self.last_artist_saved_id = state["last_artist_saved_id"]
+        self.last_song_saved_id = state["last_song_saved_id"]
+        self.input_playlist_id = state["input_playlist_id"]
+        self.output_playlist_id = state["output_playlist_id"]
+        self.wanted_songs_per_artist = (
+            int(state["wanted_songs_per_artist"])
+            if state["wanted_songs_per_artist"] is not None
+            else None
+        )
+        artists_ids = state["artists_ids"]
+        artists_names = state.get("artists_names") or [None] * len(artists_ids)
+        self.artists = [
+            {"id": artist_id, "name": name}
+            for artist_id, name in zip(artists_ids, artists_names)
+        ]
+        self.last_artist_saved_index = state.get("last_artist_saved_index")
+        if (
+            self.last_artist_saved_index is None
+            and self.last_artist_saved_id is not None
+        ):
+            try:
+                self.last_artist_saved_index = artists_ids.index(
+                    self.last_artist_saved_id
+                )
+            except ValueError:
+                # Nothing left to resume, as before the index was kept
+                self.last_artist_saved_index = len(artists_ids)
+        self.started_at = datetime.datetime.fromisoformat(state["started_at"])
+        self.last_updated_at = (
+            datetime.datetime.fromisoformat(state["last_updated_at"])
+            if state["last_updated_at"] is not None
+            else None
+        )
+
+    def _read(self, data, filename):
+        magic, version = STATE_HEADER.unpack_from(data)
+        if version not in self.STATE_FIELDS:
+            raise ValueError(f"Unsupported state file version {version} in {filename}")
+        state = dict(
+            zip(self.STATE_FIELDS[version], _unpack_fields(data, STATE_HEADER.size))
+        )
+        artists_ids = state["artists_ids"]
+        state["artists_ids"] = artists_ids.split("\n") if artists_ids else []
+        if state.get("artists_names") is not None:
+            state["artists_names"] = (
+                state["artists_names"].split("\0") if artists_ids else []
+            )
+        if state.get("last_artist_saved_index") is not None:
+            state["last_artist_saved_index"] = int(state["last_artist_saved_index"])
+        return state
+
+    def delete_state_file(self):
+        if self.filename is not None:
+            os.remove(self.filename)
+
+
+def migrate_state_file(filename):
+    """ Rewrites a _state.json file in the current format, returns the new
+        file name
+    """
+    program_state = ProgramState()
+    program_state.load_state_from_file(filename)
+    program_state.save_state()
+    return program_state.filename
+
+
+def trace_span(name, cat="stage", **args):
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.span(name, cat=cat, **args)
+
+
+def make_request(
+    spotify_client,
+    request,
+    *args,
+    rate_limit_retry_count=0,
+    cancel_event=None,
+    **kwargs,
+):
+    """
+    cancel_event: optional threading.Event, setting it stops a rate limit
+    wait and raises the rate limit error
+    """
+    if rate_limit_retry_count >= MAX_RETRY_COUNT_RATE_LIMIT:
+        print("Max retry count reached, stopping")
+        raise Exception("Max retry count reached")
+        # return None
 
-def is_json_serializable(obj):
     try:
-        json.dumps(obj)
-        return True
-    except:
-        return False
+        return request(*args, **kwargs)
+    except spotipy.client.SpotifyException as e:
+        if isinstance(e, SpotifyPartialWriteException) and e.committed > 0:
+            # Retrying would write the committed items twice, the caller
+            # resumes with the rest
+            raise
+        if e.http_status == 429:
+            try:
+                retry_after = int(e.headers["Retry-After"])
+            except (KeyError, ValueError):
+                print("No Retry-After header found, waiting 120 seconds")
+                retry_after = 120
+
+            if retry_after < 31:
+                retry_after = 31
+
+            print(f"Rate limit reached, waiting {retry_after} seconds")
+            with trace_span("rate limit wait", cat="rate-limit", retry_after=retry_after):
+                if cancel_event is None:
+                    time.sleep(retry_after)
+                elif cancel_event.wait(retry_after):
+                    raise e
+            return make_request(
+                spotify_client,
+                request,
+                *args,
+                rate_limit_retry_count=rate_limit_retry_count + 1,
+                cancel_event=cancel_event,
+                **kwargs,
+            )
+        else:
+            print(f"A Spotify error occurred: {e}")
+            raise e
+            # return None
+
+
+def get_playlist_tracks(playlist_id, spotify_client):
+    results = make_request(spotify_client, spotify_client.playlist_tracks, playlist_id)
+    tracks = results["items"]
+    while results["next"]:
+        results = spotify_client.next(results)
+        tracks.extend(results["items"])
+    return tracks
+
+
+def iter_playlist_artists(playlist_id, spotify_client):
+    """
+    Yields the artists of the tracks of a playlist as its pages are read,
+    each artist once, as {"id", "name"}.
+    """
+    seen = set()
+    results = make_request(
+        spotify_client,
+        spotify_client.playlist_tracks,
+        playlist_id,
+        fields="items(track(artists(id,name))),next",
+    )
+    while True:
+        for item in results["items"]:
+            if not item.get("track"):
+                continue
+            for artist in item["track"]["artists"]:
+                if artist["name"] not in seen:
+                    seen.add(artist["name"])
+                    yield {"id": artist["id"], "name": artist["name"]}
+        if not results["next"]:
+            return
+        results = make_request(spotify_client, spotify_client.next, results)
+
+
+def is_unwanted_song_or_album(name):
+    # remove if name contains "Edition", "Live", "Anniversary", "Remaster", "Remastered"
+    return (
+        "Edition" in name
+        or "Live" in name
+        or "Anniversary" in name
+        or "Remaster" in name
+        or "Remastered" in name
+        or "Instrumental" in name
+        or "Acoustic" in name
+        or "Instrumentals" in name
+        or "Capella" in name
+        or "Cappella" in name
+        or "Acapella" in name
+        or "Remix" in name
+    )
+
+
+def remove_unwanted_songs(songs):
+    res = [song for song in songs if not is_unwanted_song_or_album(song["name"])]
+    return res
+
+
+def get_songs_from_album_without_unwanted(album, spotify_client, catalog=None):
+    # first check if the album name is unwanted
+    if is_unwanted_song_or_album(album["name"]):
+        return []
+    if catalog is not None:
+        songs_in_album = catalog.album_songs(album["id"])
+        if songs_in_album is not None:
+            return songs_in_album
+    songs_in_album = []
+    results = make_request(spotify_client, spotify_client.album_tracks, album["id"])
+    requests = 1
+    songs_in_album.extend(results["items"])
+    while results["next"]:
+        results = make_request(spotify_client, spotify_client.next, results)
+        songs_in_album.extend(results["items"])
+        requests += 1
+    songs_in_album = remove_unwanted_songs(songs_in_album)
+    if catalog is not None:
+        catalog.add_album_songs(album["id"], songs_in_album, requests)
+    return songs_in_album
+
+
+def remove_duplicate_songs(songs):
+    # check with title/duration
+    res = []
+    for song in songs:
+        if song not in res and song["name"] not in [s["name"] for s in res]:
+            res.append(song)
+    return res
+
+
+def get_artist_albums(
+    artist, spotify_client, include_groups="album,single", known_album_ids=None
+):
+    """
+    Lists the albums of the artist. Albums come newest first, so when
+    known_album_ids is given the listing stops at the first known album and
+    only the releases published since are returned.
+    """
+    albums = []
+    with trace_span("album listing", artist=artist["name"], include_groups=include_groups):
+        results = make_request(
+            spotify_client,
+            spotify_client.artist_albums,
+            artist["id"],
+            include_groups=include_groups,
+        )
+
+        while True:
+            for album in results["items"]:
+                if known_album_ids is not None and album["id"] in known_album_ids:
+                    return albums
+                albums.append(album)
+            if not results["next"]:
+                break
+            results = make_request(spotify_client, spotify_client.next, results)
+            if len(results["items"]) == 0:
+                break
+
+    return albums
+
+
+def get_artist_songs(
+    artist,
+    spotify_client,
+    include_groups="album,single",
+    progress_callback=None,
+    albums=None,
+    catalog=None,
+):
+    # for some reason separate album and single requests return more songs
+    if albums is None:
+        albums = get_artist_albums(artist, spotify_client, include_groups)
+
+    artist_songs = []
+    total_albums = len(albums)
+    with trace_span("track fetch", artist=artist["name"], albums=total_albums):
+        for i, album in enumerate(albums):
+            if progress_callback:
+                progress_callback(i, total_albums)
+            songs = get_songs_from_album_without_unwanted(album, spotify_client, catalog)
+            # print(f"Number of songs found for {album['name']}: {len(songs)}")
+            artist_songs.extend(songs)
+
+    return artist_songs
+
+
+def get_full_albums(albums, spotify_client, catalog=None):
+    """ Full album objects of the albums, which hold their popularity and
+        the first page of their tracks
+    """
+    albums_ids = [album["id"] for album in albums]
+    known = catalog.full_albums(albums_ids) if catalog is not None else {}
+    missing = [album_id for album_id in dict.fromkeys(albums_ids) if album_id not in known]
+    fetched = {}
+    # albums is limited to 20 per request
+    with trace_span("album details", albums=len(missing)):
+        for i in range(0, len(missing), 20):
+            results = make_request(
+                spotify_client, spotify_client.albums, missing[i : i + 20]
+            )
+            fetched.update(zip(missing[i : i + 20], results["albums"]))
+    if catalog is not None:
+        catalog.add_full_albums(fetched)
+        catalog.avoided(-(-len(albums_ids) // 20) - -(-len(missing) // 20))
+    known.update(fetched)
+    return [known[album_id] for album_id in albums_ids]
+
+
+def get_full_album_songs(album, spotify_client, catalog=None):
+    """ Songs of a full album object without the unwanted ones, and the
+        number of requests needed to read the pages of tracks it lacks
+    """
+    if catalog is not None:
+        songs = catalog.album_songs(album["id"])
+        if songs is not None:
+            return songs, 0
+    results = album["tracks"]
+    songs = list(results["items"])
+    requests = 0
+    while results["next"]:
+        results = make_request(spotify_client, spotify_client.next, results)
+        songs.extend(results["items"])
+        requests += 1
+    songs = remove_unwanted_songs(songs)
+    if catalog is not None:
+        catalog.add_album_songs(album["id"], songs, requests)
+    return songs, requests
+
+
+def get_songs_popularity(songs, spotify_client, catalog=None):
+    """ Returns the full track objects of the songs, which hold their
+        popularity, in the same order
+    """
+    songs_ids = [song["id"] for song in songs]
+    known = catalog.tracks(songs_ids) if catalog is not None else {}
+    missing = [song_id for song_id in dict.fromkeys(songs_ids) if song_id not in known]
+    fetched = {}
+    # tracks is limited to 50 per request, so we need to split the list
+    with trace_span("popularity", songs=len(missing)):
+        for i in range(0, len(missing), 50):
+            results = make_request(
+                spotify_client, spotify_client.tracks, missing[i : i + 50]
+            )
+            fetched.update(zip(missing[i : i + 50], results["tracks"]))
+    if catalog is not None:
+        catalog.add_tracks(fetched)
+        catalog.avoided(-(-len(songs_ids) // 50) - -(-len(missing) // 50))
+    known.update(fetched)
+    return [known[song_id] for song_id in songs_ids]
+
+
+def sort_songs_by_popularity(songs, spotify_client):
+    songs_popularity = get_songs_popularity(songs, spotify_client)
+    return sorted(songs_popularity, key=lambda x: x["popularity"], reverse=True)
+
+
+def select_songs(first_songs, ranked_songs, count, excluded_names=()):
+    """
+    Returns the same songs as
+    remove_duplicate_songs(first_songs + sorted ranked_songs)[:count], the
+    ranked songs being sorted by decreasing popularity, without sorting them
+    nor comparing every song with the ones already kept.
+
+    Songs are told apart by name, the first song of a name wins: so only the
+    most popular (then first) ranked song of every name not kept yet is a
+    candidate, and the `count` best candidates are taken with a bounded
+    heap. Songs named like one of `excluded_names` are never selected.
+    """
+    selected = []
+    names = set(excluded_names)
+    for song in first_songs:
+        if len(selected) == count:
+            return selected
+        if song["name"] not in names:
+            names.add(song["name"])
+            selected.append(song)
+
+    # Best (-popularity, index) per name, the index keeps the sort stable
+    best = {}
+    for index, song in enumerate(ranked_songs):
+        name = song["name"]
+        if name in names:
+            continue
+        rank = (-song["popularity"], index)
+        if name not in best or rank < best[name][:2]:
+            best[name] = (*rank, song)
+    selected.extend(
+        song for _, _, song in heapq.nsmallest(count - len(selected), best.values())
+    )
+    return selected
+
+
+def get_artist_top_10_songs(artist, spotify_client):
+    results = make_request(
+        spotify_client, spotify_client.artist_top_tracks, artist["id"]
+    )
+    top_tracks = results["tracks"]
+    return top_tracks
+
+
+def create_playlist(playlist_name, spotify_client, public=False):
+    me = make_request(spotify_client, spotify_client.me)
+    playlist = make_request(
+        spotify_client,
+        spotify_client.user_playlist_create,
+        me["id"],
+        playlist_name,
+        public=public,
+    )
+    return playlist
+
+
+def get_user_playlists(spotify_client):
+    playlists = make_request(spotify_client, spotify_client.current_user_playlists)
+    return playlists
+
+
+def get_user_followed_artists(spotify_client):
+    followed_artists = []
+    results = make_request(spotify_client, spotify_client.current_user_followed_artists)
+    followed_artists.extend(results["artists"]["items"])
+    while results["artists"]["next"]:
+        results = spotify_client.next(results["artists"])
+        followed_artists.extend(results["artists"]["items"])
+
+    return followed_artists
+
+
+class Progress:
+    """
+    Progression of a run, updated by the generator and read by the
+    interactive front end.
+    """
+
+    def __init__(self):
+        self.total_artists = 0
+        self.current_artist = 0
+        self.percentage = 0
+
+    def update(self, progression_in_current_artist):
+        if self.total_artists == 0:
+            return
+        progression_per_artist = 1 / self.total_artists
+        current_progression = (
+            self.current_artist - 1
+        ) / self.total_artists + progression_per_artist * progression_in_current_artist
+        self.percentage = current_progression * 100
+
+    def album_callback(self, i, total):
+        # 0-50%
+        self.update((i + 1) / total / 2)
+
+    def single_callback(self, i, total):
+        # 50-100%
+        self.update(0.5 + (i + 1) / total / 2)
+
+
+class ArtistSongsCache:
+    """
+    Songs crawled per artist, shared by the generators of a process so that
+    an artist appearing in several source playlists is only crawled once.
+
+    Two generators asking for the same artist at the same time wait for a
+    single crawl.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, crawl):
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    self.hits += 1
+                    return list(self._entries[key])
+            songs = crawl()
+            with self._lock:
+                self._entries[key] = songs
+                self.misses += 1
+            return list(songs)
+
+
+class ReleaseIndex:
+    """
+    Album IDs already seen per artist and when they were last checked, so
+    that an incremental run only fetches the releases published since.
+
+    Stored as JSON:
+    {"version": 1, "artists": {artist_id: {"albums": [...], "checked_at": ...}}}
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, recheck_after: float = 0):
+        """
+        recheck_after: seconds during which an artist checked by a previous
+        run is considered up to date and not listed again
+        """
+        self.path = path
+        self.recheck_after = recheck_after
+        self._lock = threading.Lock()
+        self._artists = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                index = json.load(f)
+            if index.get("version") != self.VERSION:
+                raise ValueError(f"Unsupported release index version in {path}")
+            self._artists = index["artists"]
+
+    def known_albums(self, artist_id):
+        """ Returns the set of album IDs seen for the artist, or None """
+        with self._lock:
+            entry = self._artists.get(artist_id)
+        if entry is None:
+            return None
+        return set(entry["albums"])
+
+    def is_fresh(self, artist_id):
+        with self._lock:
+            entry = self._artists.get(artist_id)
+        if entry is None or self.recheck_after <= 0:
+            return False
+        checked_at = datetime.datetime.fromisoformat(entry["checked_at"])
+        age = (datetime.datetime.now() - checked_at).total_seconds()
+        return age < self.recheck_after
+
+    def record(self, artist_id, album_ids):
+        with self._lock:
+            entry = self._artists.setdefault(artist_id, {"albums": []})
+            known = set(entry["albums"])
+            entry["albums"].extend(
+                album_id for album_id in album_ids if album_id not in known
+            )
+            entry["checked_at"] = datetime.datetime.now().isoformat()
+
+    def save(self):
+        with self._lock:
+            data = json.dumps({"version": self.VERSION, "artists": self._artists})
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self):
+        return len(self._artists)
+
+
+class ArtistPrefetcher:
+    """
+    Speculatively crawls the artists of a source playlist into the artist
+    cache of a generator while the user is still answering prompts.
+
+    A reader thread streams the artists of the source playlist (priming the
+    source cache of the generator), a worker thread prefetches them as they
+    arrive: top tracks and album listings first, then whole discographies
+    once `set_songs_per_artist` asks for more than 10 songs per artist. A
+    run started afterwards finds the artists in the cache, or waits for
+    the one being prefetched instead of crawling it twice.
+
+    Prefetching is best effort: failures are counted and left to the run.
+    `delay` seconds are waited between two artists to leave room for other
+    requests, and `stop` cancels everything not started yet.
+    """
+
+    def __init__(self, generator, source_playlist_id, delay: float = 0.0):
+        if generator.artist_cache is None:
+            raise ValueError("Prefetching needs a generator with an artist cache")
+        self.generator = generator
+        self.source_playlist_id = source_playlist_id
+        self.delay = delay
+        self.songs_per_artist = None
+        self.source_read = threading.Event()
+        self.failed = 0
+        self._prefetched = set()
+        self._artists = []
+        self._seen = set()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._stop_event = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._read, name="explore-prefetch-reader"),
+            threading.Thread(target=self._work, name="explore-prefetch-worker"),
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    @property
+    def prefetched(self):
+        """ Number of artists prefetched so far """
+        return len(self._prefetched)
+
+    def wait_for_source(self, timeout=None):
+        """ Waits until the source playlist was read, returns False on timeout """
+        return self.source_read.wait(timeout)
+
+    def add_artists(self, artists):
+        """ Prefetches these artists too (e.g. the followed artists) """
+        with self._lock:
+            for artist in artists:
+                if artist["id"] not in self._seen:
+                    self._seen.add(artist["id"])
+                    self._artists.append(artist)
+                    self._queue.put((artist, self.songs_per_artist))
+
+    def set_songs_per_artist(self, songs_per_artist):
+        """ Once more than 10 songs per artist are wanted, the discographies of
+            the artists are prefetched as well
+        """
+        with self._lock:
+            self.songs_per_artist = songs_per_artist
+            if songs_per_artist > 10:
+                for artist in self._artists:
+                    self._queue.put((artist, songs_per_artist))
+
+    def _read(self):
+        try:
+            for artist in self.generator.stream_artists(self.source_playlist_id):
+                if self._stop_event.is_set():
+                    return
+                self.add_artists([artist])
+        except Exception:
+            # The run reads the source playlist again and reports the error
+            self.failed += 1
+        finally:
+            self.source_read.set()
+
+    def _work(self):
+        while not self._stop_event.is_set():
+            try:
+                artist, songs_per_artist = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            try:
+                self.generator.prefetch_artist(artist, songs_per_artist)
+                self._prefetched.add(artist["id"])
+            except Exception:
+                self.failed += 1
+            if self.delay > 0:
+                self._stop_event.wait(self.delay)
+
+    def stop(self):
+        """ Cancels the prefetches not started yet, the current one finishes
+            in the background
+        """
+        self._stop_event.set()
+
+
+class SourcePlaylistCache:
+    """
+    Artists extracted from every source playlist, along with the snapshot_id
+    of the playlist they were extracted from. As long as the snapshot_id of a
+    playlist doesn't change, its artists are reused instead of reading all
+    its tracks again.
+
+    Stored as JSON:
+    {"version": 1, "playlists": {playlist_id: {"snapshot_id": ..., "artists": [...]}}}
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._playlists = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                cache = json.load(f)
+            if cache.get("version") == self.VERSION:
+                self._playlists = cache["playlists"]
+
+    def get(self, playlist_id, snapshot_id):
+        """ Returns the artists of the playlist at snapshot_id, or None """
+        with self._lock:
+            entry = self._playlists.get(playlist_id)
+            if entry is None or entry["snapshot_id"] != snapshot_id:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [dict(artist) for artist in entry["artists"]]
+
+    def set(self, playlist_id, snapshot_id, artists):
+        with self._lock:
+            self._playlists[playlist_id] = {
+                "snapshot_id": snapshot_id,
+                "artists": [
+                    {"id": artist["id"], "name": artist["name"]} for artist in artists
+                ],
+            }
+            data = json.dumps({"version": self.VERSION, "playlists": self._playlists})
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+
+
+class CheckpointJournal:
+    """
+    Append-only journal of a run, one JSON record per line:
+
+    {"type": "run", ...}                   settings and artists of the run (None
+                                           when they are streamed, they are
+                                           then read again on resume)
+    {"type": "artist", "id": ..., "uris": [...]}
+                                           artist done, with its selected songs
+    {"type": "write", "count": n}          next n selected songs added to the
+                                           output playlist
+
+    Replaying it gives back everything a resumed run needs without any API
+    call: completed artists are skipped and the selected songs which were
+    not written yet are queued again.
+
+    Records are flushed as they are appended, and synced to disk every
+    `fsync_every` records or `fsync_interval` seconds. Write records are
+    synced right away: losing one would add its songs twice on resume.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, fsync_every: int = 50, fsync_interval: float = 1.0):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.run = None
+        self.completed_artists = set()
+        self.selected_uris = []
+        self.written = 0
+        self._file = None
+        # The playlist writer appends write records from its own thread
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        if os.path.exists(path):
+            self._replay()
+
+    def _replay(self):
+        valid_length = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                # A crash may leave a truncated last record, which is dropped
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                valid_length += len(line)
+                if record["type"] == "run":
+                    if record.get("version") != self.VERSION:
+                        raise ValueError(f"Unsupported journal version in {self.path}")
+                    self.run = record
+                elif record["type"] == "artist":
+                    self.completed_artists.add(record["id"])
+                    self.selected_uris.extend(record["uris"])
+                elif record["type"] == "write":
+                    self.written += record["count"]
+        if valid_length < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_length)
+
+    @property
+    def pending_uris(self):
+        """ Selected songs not added to the output playlist yet """
+        return self.selected_uris[self.written :]
+
+    def _append(self, record, sync=False):
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a")
+            self._file.write(line)
+            self._file.flush()
+            self._unsynced += 1
+            if (
+                sync
+                or self._unsynced >= self.fsync_every
+                or time.monotonic() - self._synced_at >= self.fsync_interval
+            ):
+                self._sync()
+
+    def _sync(self):
+        if self._file is None or self._unsynced == 0:
+            return
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def start_run(
+        self,
+        input_playlist_id,
+        output_playlist_id,
+        songs_per_artist,
+        artists,
+        position=None,
+        include_followed_artists=False,
+    ):
+        """
+        artists: None when the artists are streamed from the source playlist
+        position: where the first song of the run goes in the output
+        playlist, None when the songs are appended
+        """
+        self.run = {
+            "type": "run",
+            "version": self.VERSION,
+            "input_playlist_id": input_playlist_id,
+            "output_playlist_id": output_playlist_id,
+            "songs_per_artist": songs_per_artist,
+            "position": position,
+            "artists": None,
+        }
+        if artists is None:
+            self.run["include_followed_artists"] = include_followed_artists
+        else:
+            self.run["artists"] = [
+                {"id": artist["id"], "name": artist["name"]} for artist in artists
+            ]
+        self._append(self.run, sync=True)
+
+    def artist_done(self, artist_id, uris):
+        self.completed_artists.add(artist_id)
+        self.selected_uris.extend(uris)
+        self._append({"type": "artist", "id": artist_id, "uris": uris})
+
+    def record_write(self, count):
+        self.written += count
+        self._append({"type": "write", "count": count}, sync=True)
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            self._sync()
+            self._file.close()
+            self._file = None
+
+    def complete(self):
+        """ Removes the journal of a finished run, nothing is left to resume """
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def find_journal_files():
+    return [
+        f for f in os.listdir(".") if os.path.isfile(f) and f.endswith("_journal.jsonl")
+    ]
+
+
+class PlaylistWriter:
+    """
+    Write-behind writer adding songs to a playlist from a background thread,
+    so that crawling goes on while the songs are being written.
+
+    Songs are buffered until a full batch of 100 is ready, which is then
+    queued for the writer. The queue is bounded: when the writer falls
+    behind, `add` blocks until a batch has been written. Batches are
+    written in order at explicit positions, and `on_commit(count, tag)` is
+    called from the writer thread after every batch, with the tag of its
+    last song.
+    """
+
+    BATCH_SIZE = 100
+
+    def __init__(
+        self,
+        spotify_client,
+        playlist_id: str,
+        position: int = None,
+        max_queued_batches: int = 4,
+        on_commit=None,
+    ):
+        """
+        position: where the first song goes in the playlist, None to append
+        """
+        self.sp = spotify_client
+        self.playlist_id = playlist_id
+        self.position = position
+        self.on_commit = on_commit
+        # Only changed by the writer thread
+        self.committed = 0
+        self._dropped = 0
+        self._buffer = []
+        self._queue = queue.Queue(maxsize=max_queued_batches)
+        # Songs handed to the writer, only changed by the caller's thread
+        self._enqueued = 0
+        self._aborted = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._write_batches, name="explore-playlist-writer", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """ Number of songs added but not written yet """
+        return len(self._buffer) + self._enqueued - self.committed - self._dropped
+
+    def add(self, uri, tag=None):
+        self._buffer.append((uri, tag))
+        if len(self._buffer) >= self.BATCH_SIZE:
+            batch = self._buffer[: self.BATCH_SIZE]
+            del self._buffer[: self.BATCH_SIZE]
+            self._enqueue(batch)
+
+    def _enqueue(self, batch):
+        self._enqueued += len(batch)
+        while True:
+            if self._error is not None:
+                self._enqueued -= len(batch)
+                raise self._error
+            try:
+                self._queue.put(batch, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _write_batches(self):
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                # A previous batch failed, writing the next ones would break the order
+                self._dropped += len(batch)
+                continue
+            uris = [uri for uri, _ in batch]
+            kwargs = {}
+            if self.position is not None:
+                kwargs["position"] = self.position + self.committed
+            try:
+                with trace_span("write", items=len(uris)):
+                    make_request(
+                        self.sp,
+                        self.sp.playlist_add_items,
+                        self.playlist_id,
+                        uris,
+                        cancel_event=self._aborted,
+                        **kwargs,
+                    )
+                self.committed += len(batch)
+                if self.on_commit is not None:
+                    self.on_commit(len(batch), batch[-1][1])
+            except BaseException as e:
+                self._dropped += len(batch)
+                self._error = e
+
+    def close(self):
+        """ Writes the remaining songs, waits for the writer and raises its
+            error if a batch couldn't be written
+        """
+        if len(self._buffer) > 0:
+            batch = self._buffer
+            self._buffer = []
+            self._enqueue(batch)
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def abort(self):
+        """ Drops the buffered and queued songs and waits for the batch being
+            written, so that on_commit isn't called once abort returns. A
+            batch waiting for a rate limit is given up.
+        """
+        self._error = self._error or RuntimeError("Playlist writer aborted")
+        self._aborted.set()
+        self._buffer = []
+        # The writer skips the queued batches once _error is set
+        self._queue.put(None)
+        self._thread.join()
+
+
+class CatalogRegistry:
+    """
+    Albums and tracks resolved during a run, shared by all its artists.
+
+    Collaborations and compilations are listed under several artists: the
+    tracks of such an album are listed once, and the popularity of a track
+    is looked up once (the top tracks of the artists seed it), later
+    artists reuse them. `requests_avoided` counts the requests saved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # album ID -> (songs without the unwanted ones, requests it took)
+        self._album_songs = {}
+        self._full_albums = {}
+        self._tracks = {}
+        self.album_hits = 0
+        self.track_hits = 0
+        self.requests_avoided = 0
+
+    def album_songs(self, album_id):
+        """ Songs of the album if it was listed already, or None """
+        with self._lock:
+            entry = self._album_songs.get(album_id)
+            if entry is None:
+                return None
+            self.album_hits += 1
+            self.requests_avoided += entry[1]
+            return entry[0]
+
+    def add_album_songs(self, album_id, songs, requests):
+        with self._lock:
+            self._album_songs[album_id] = (songs, requests)
+
+    def missing_album_songs(self, album_ids):
+        with self._lock:
+            return {album_id for album_id in album_ids if album_id not in self._album_songs}
+
+    def full_albums(self, album_ids):
+        """ Full album objects already fetched, by ID """
+        with self._lock:
+            return {
+                album_id: self._full_albums[album_id]
+                for album_id in album_ids
+                if album_id in self._full_albums
+            }
+
+    def add_full_albums(self, albums):
+        """ albums: full album objects by ID """
+        with self._lock:
+            self._full_albums.update(albums)
+
+    def tracks(self, track_ids):
+        """ Full track objects already looked up, by ID """
+        with self._lock:
+            tracks = {
+                track_id: self._tracks[track_id]
+                for track_id in track_ids
+                if track_id in self._tracks
+            }
+            self.track_hits += len(tracks)
+        return tracks
+
+    def missing_tracks(self, track_ids):
+        with self._lock:
+            return {track_id for track_id in track_ids if track_id not in self._tracks}
+
+    def add_tracks(self, tracks):
+        """ tracks: full track objects by ID """
+        with self._lock:
+            self._tracks.update(tracks)
+
+    def avoided(self, requests):
+        with self._lock:
+            self.requests_avoided += requests
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "albums": len(self._album_songs),
+                "tracks": len(self._tracks),
+                "album_hits": self.album_hits,
+                "track_hits": self.track_hits,
+                "requests_avoided": self.requests_avoided,
+            }
+
+
+class PruningStats:
+    """
+    Requests saved by the popularity-bounded pruning of the discographies
+    and, for the artists audited against the exact mode, how many of the
+    songs selected by the exact mode the pruned mode selected too.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.artists = 0
+        self.albums = 0
+        self.albums_looked_up = 0
+        self.songs = 0
+        self.songs_looked_up = 0
+        # tracks() requests, and every request of the discography crawl, the
+        # exact ones being what an exact run would send (see _exact_requests)
+        self.tracks_requests = 0
+        self.exact_tracks_requests = 0
+        self.requests = 0
+        self.exact_requests = 0
+        self.audited_artists = 0
+        self.audited_songs = 0
+        self.audited_matches = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+    def as_dict(self):
+        with self._lock:
+            stats = {
+                name: value
+                for name, value in self.__dict__.items()
+                if not name.startswith("_")
+            }
+        stats["tracks_requests_saved"] = (
+            stats["exact_tracks_requests"] - stats["tracks_requests"]
+        )
+        stats["requests_saved"] = stats["exact_requests"] - stats["requests"]
+        # Share of the songs selected by the exact mode which were selected
+        stats["audit_recall"] = (
+            stats["audited_matches"] / stats["audited_songs"]
+            if stats["audited_songs"] > 0
+            else None
+        )
+        return stats
+
+
+class RunConfig:
+    """
+    Everything a run needs, so that it can be started without any prompt.
+
+    Either `state` (a loaded ProgramState to resume) or `source_playlist_id`
+    must be given. `artists` may be given to skip the extraction of the
+    artists of the source playlist (see PlaylistGenerator.collect_artists).
+
+    With a `journal`, the progress of the run is checkpointed; when the
+    journal already holds a run, that run is resumed from it.
+
+    With a `release_index`, the albums listed for every artist are recorded.
+    An `incremental` run then only adds the songs of the releases published
+    since, into the existing `output_playlist_id`; every artist still keeps
+    at most `songs_per_artist` songs, its least popular ones making room.
+
+    A `sync` run selects the songs like a full run, then only writes the
+    differences with the existing `output_playlist_id`.
+
+    With `prune_slack`, the popularity of the songs of the discographies is
+    only looked up for the most popular albums, assuming that no song is
+    more than `prune_slack` points more popular than its album; one artist
+    out of `prune_audit_every` is then crawled in the exact mode as well to
+    measure the songs missed (see PruningStats).
+
+    With `stream_artists`, the crawl starts as soon as the first page of the
+    source playlist is read: the artists are explored in playlist order
+    instead of being sorted by name. Such a run can only be resumed from its
+    journal.
+    """
+
+    def __init__(
+        self,
+        source_playlist_id: str = None,
+        songs_per_artist: int = 10,
+        output_playlist_name: str = None,
+        output_playlist_id: str = None,
+        include_followed_artists: bool = False,
+        public: bool = False,
+        artists: list = None,
+        state: ProgramState = None,
+        release_index: ReleaseIndex = None,
+        incremental: bool = False,
+        journal: CheckpointJournal = None,
+        sync: bool = False,
+        stream_artists: bool = False,
+        prune_slack: int = None,
+        prune_audit_every: int = 0,
+    ):
+        self.source_playlist_id = source_playlist_id
+        self.songs_per_artist = songs_per_artist
+        self.output_playlist_name = output_playlist_name
+        self.output_playlist_id = output_playlist_id
+        self.include_followed_artists = include_followed_artists
+        self.public = public
+        self.artists = artists
+        self.state = state
+        self.release_index = release_index
+        self.incremental = incremental
+        self.journal = journal
+        self.sync = sync
+        self.stream_artists = stream_artists
+        self.prune_slack = prune_slack
+        self.prune_audit_every = prune_audit_every
+
+
+class RunResult:
+    def __init__(
+        self,
+        output_playlist_id: str,
+        artists_count: int,
+        songs: list,
+        sync_stats: dict = None,
+        pruning_stats: dict = None,
+        catalog_stats: dict = None,
+    ):
+        self.output_playlist_id = output_playlist_id
+        self.artists_count = artists_count
+        self.songs = songs
+        # Writes done by a sync run, see spotipy.playlist_sync.sync_playlist
+        self.sync_stats = sync_stats
+        # See PruningStats.as_dict
+        self.pruning_stats = pruning_stats
+        # See CatalogRegistry.as_dict
+        self.catalog_stats = catalog_stats
 
 
 class PlaylistGenerator:
@@ -46,11 +1395,12 @@ class PlaylistGenerator:
             try:
                 with open(filename, "w") as file:
                     values_to_save = {
-                        key: value if is_json_serializable(value) else str(value)
+                        key: value
                         for key, value in self.__dict__.items()
                         if key not in self.values_to_exclude
                     }
-                    json.dump(values_to_save, file, indent=4)
+                    # Values which aren't serializable are saved as strings
+                    json.dump(values_to_save, file, separators=(",", ":"), default=str)
             except IOError as e:
                 print(f"Couldn't save state to file: {e}")
 
@@ -77,70 +1427,1076 @@ class PlaylistGenerator:
         spotify_client_id: str,
         spotify_client_secret: str,
         spotify_redirect_uri: str,
+        spotify_client: spotipy.Spotify = None,
+        request_listeners: list = None,
+        metrics=None,
+        profiler=None,
+        artist_cache: ArtistSongsCache = None,
+        source_cache: SourcePlaylistCache = None,
     ):
+        """
+        spotify_client: use this client instead of building one, to share
+        its connection pools and caches between several generators
+        artist_cache: optional ArtistSongsCache shared between generators
+        source_cache: optional SourcePlaylistCache, to skip reading source
+        playlists which didn't change since they were last read
+        metrics: optional explore_metrics.Metrics updated while crawling
+        profiler: optional explore_profile.Profiler, a stage is opened for
+        every step of a run
+        """
         self.spotify_client_id = spotify_client_id
         self.spotify_client_secret = spotify_client_secret
         self.spotify_redirect_uri = spotify_redirect_uri
-        self.sp = spotipy.Spotify(
-            auth_manager=SpotifyOAuth(
-                scope=PlaylistGenerator.SPOTIFY_API_SCOPE_NEEDED,
-                client_id=self.spotify_client_id,
-                client_secret=self.spotify_client_secret,
-                redirect_uri=self.spotify_redirect_uri,
+        if spotify_client is None:
+            spotify_client = spotipy.Spotify(
+                auth_manager=SpotifyOAuth(
+                    scope=PlaylistGenerator.SPOTIFY_API_SCOPE_NEEDED,
+                    client_id=self.spotify_client_id,
+                    client_secret=self.spotify_client_secret,
+                    redirect_uri=self.spotify_redirect_uri,
+                    background_refresh=True,
+                ),
+                request_listeners=request_listeners,
             )
-        )
+        self.sp = spotify_client
+        self.metrics = metrics
+        self.profiler = profiler
+        self.artist_cache = artist_cache
+        self.source_cache = source_cache
+        self.release_index = None
+        self.journal = None
+        self.prune_slack = None
+        self.prune_audit_every = 0
+        self.pruning = None
+        self.catalog = CatalogRegistry()
+        self._exact_catalog = None
+        self._listed_albums = {}
         self.state = self.State()
+        self.progress = Progress()
+        # State of the current run, saved by the caller when interrupted
+        self.program_state = ProgramState()
+
+    def profile_stage(self, name):
+        if self.profiler is not None:
+            self.profiler.stage(name)
+
+    def _update_metrics(self, artists_done, tracks_queued, pending_writes):
+        if self.metrics is None:
+            return
+        self.metrics.set_gauge(
+            "explore_artists_done", artists_done, help="Artists fully processed."
+        )
+        self.metrics.set_gauge(
+            "explore_tracks_queued",
+            tracks_queued,
+            help="Tracks selected for the playlist.",
+        )
+        self.metrics.set_gauge(
+            "explore_pending_writes",
+            pending_writes,
+            help="Tracks waiting to be sent with playlist_add_items.",
+        )
+
+    def collect_artists(self, source_playlist_id, include_followed_artists=False):
+        """
+        Returns the artists of the source playlist (and the followed
+        artists if asked), without duplicates and sorted by name.
+        """
+        self.profile_stage("source playlist")
+        with trace_span("source playlist"):
+            artists = list(
+                self.stream_artists(source_playlist_id, include_followed_artists)
+            )
+        return sorted(artists, key=lambda x: x["name"])
+
+    def stream_artists(self, source_playlist_id, include_followed_artists=False):
+        """
+        Yields the artists of the source playlist in playlist order, as its
+        pages are read, then the followed artists if asked, without
+        duplicates.
+        """
+        seen = set()
+        for artist in self._source_playlist_artists(source_playlist_id):
+            seen.add(artist["name"])
+            yield artist
+        if include_followed_artists:
+            for artist in get_user_followed_artists(self.sp):
+                if artist["name"] not in seen:
+                    seen.add(artist["name"])
+                    yield {"id": artist["id"], "name": artist["name"]}
+
+    def _source_playlist_artists(self, source_playlist_id):
+        snapshot_id = None
+        if self.source_cache is not None:
+            # Read before the tracks: if the playlist changes in between, the
+            # stored snapshot_id is older than the artists and won't match
+            snapshot_id = make_request(
+                self.sp, self.sp.playlist, source_playlist_id, fields="snapshot_id"
+            )["snapshot_id"]
+            artists = self.source_cache.get(source_playlist_id, snapshot_id)
+            if artists is not None:
+                yield from artists
+                return
+
+        artists = []
+        for artist in iter_playlist_artists(source_playlist_id, self.sp):
+            artists.append(artist)
+            yield artist
+        # Only reached once the whole playlist was read
+        if self.source_cache is not None:
+            self.source_cache.set(source_playlist_id, snapshot_id, artists)
+
+    def _streamed_run_artists(self, source_playlist_id, include_followed_artists):
+        """ Artists of a streamed run, added to the program state and to the
+            progress as they are read
+        """
+        for artist in self.stream_artists(source_playlist_id, include_followed_artists):
+            self.program_state.artists.append(artist)
+            self.progress.total_artists += 1
+            yield artist
+
+    def _resume_artists(self, program_state: ProgramState):
+        """
+        Returns the artists left to process, from the last saved one
+        (included), and the position of the first of them.
+        """
+        index = program_state.last_artist_saved_index or 0
+        artists = program_state.artists[index:]
+
+        # States saved before the artist names were kept
+        missing_ids = [artist["id"] for artist in artists if artist["name"] is None]
+        if len(missing_ids) > 0:
+            names = {}
+            # can request max 50 artists at once
+            for i in range(0, len(missing_ids), 50):
+                request = make_request(self.sp, self.sp.artists, missing_ids[i : i + 50])
+                names.update((artist["id"], artist["name"]) for artist in request["artists"])
+            for artist in artists:
+                if artist["name"] is None:
+                    artist["name"] = names.get(artist["id"])
+        return artists, index
 
+    def run(self, config: RunConfig) -> RunResult:
+        """
+        Generates (or, when config.state is given, resumes) an explore
+        playlist without any prompt.
+        """
+        if config.state is not None and config.state.resumed:
+            program_state = config.state
+        else:
+            program_state = ProgramState()
+            program_state.started_at = datetime.datetime.now()
+        self.program_state = program_state
+        self.progress = Progress()
+        self.release_index = config.release_index
+        self.journal = config.journal
+        self.prune_slack = config.prune_slack
+        self.prune_audit_every = config.prune_audit_every
+        self.pruning = PruningStats() if config.prune_slack is not None else None
+        self.catalog = CatalogRegistry()
+        # What an exact run would have listed and looked up, for PruningStats
+        self._exact_catalog = CatalogRegistry() if self.pruning is not None else None
+        if config.incremental and (
+            config.release_index is None or config.output_playlist_id is None
+        ):
+            raise ValueError(
+                "An incremental run needs a release index and an output playlist"
+            )
+        if config.sync and config.output_playlist_id is None:
+            raise ValueError("A sync run needs an output playlist")
+        if config.stream_artists and (config.incremental or config.sync):
+            raise ValueError("Only full runs can stream their artists")
+
+        # Position of the first artist of `artists` in program_state.artists
+        artist_offset = 0
+        # Where the next song goes in the output playlist, None to append
+        write_position = None
+        if self.journal is not None and self.journal.run is not None:
+            self.profile_stage("resume")
+            run = self.journal.run
+            if run.get("position") is not None:
+                write_position = run["position"] + self.journal.written
+            songs_per_artist = run["songs_per_artist"]
+            output_playlist_id = run["output_playlist_id"]
+            program_state.input_playlist_id = run["input_playlist_id"]
+            program_state.output_playlist_id = output_playlist_id
+            program_state.wanted_songs_per_artist = songs_per_artist
+            artists = run["artists"]
+            if artists is None:
+                # Streamed run, its completed artists are skipped by the crawl
+                program_state.set_artists([])
+                artists = self._streamed_run_artists(
+                    run["input_playlist_id"], run["include_followed_artists"]
+                )
+            else:
+                program_state.set_artists(artists)
+        elif program_state.resumed:
+            self.profile_stage("resume")
+            songs_per_artist = program_state.wanted_songs_per_artist
+            artists, artist_offset = self._resume_artists(program_state)
+            output_playlist_id = program_state.output_playlist_id
+        else:
+            program_state.input_playlist_id = config.source_playlist_id
+            artists = config.artists
+            if artists is None and config.stream_artists:
+                program_state.set_artists([])
+                artists = self._streamed_run_artists(
+                    config.source_playlist_id, config.include_followed_artists
+                )
+            else:
+                if artists is None:
+                    artists = self.collect_artists(
+                        config.source_playlist_id, config.include_followed_artists
+                    )
+                program_state.set_artists(artists)
+            songs_per_artist = config.songs_per_artist
+            program_state.wanted_songs_per_artist = songs_per_artist
+
+            output_playlist_id = config.output_playlist_id
+            if output_playlist_id is None:
+                output_playlist_id = create_playlist(
+                    config.output_playlist_name,
+                    spotify_client=self.sp,
+                    public=config.public,
+                )["id"]
+                # New playlist, songs are written at explicit positions
+                write_position = 0
+            program_state.output_playlist_id = output_playlist_id
+            if self.journal is not None and not (config.incremental or config.sync):
+                self.journal.start_run(
+                    config.source_playlist_id,
+                    output_playlist_id,
+                    songs_per_artist,
+                    program_state.artists if isinstance(artists, list) else None,
+                    position=write_position,
+                    include_followed_artists=config.include_followed_artists,
+                )
+
+        if isinstance(artists, list):
+            self.progress.total_artists = len(artists)
+            if self.metrics is not None:
+                self.metrics.set_gauge(
+                    "explore_artists_total", len(artists), help="Artists to process."
+                )
+
+        sync_stats = None
+        if config.incremental:
+            songs = self._update_incrementally(
+                artists, songs_per_artist, output_playlist_id
+            )
+        elif config.sync:
+            songs, sync_stats = self._sync(artists, songs_per_artist, output_playlist_id)
+        else:
+            songs = self._crawl(
+                artists, songs_per_artist, output_playlist_id, artist_offset, write_position
+            )
+
+        if self.release_index is not None:
+            self.release_index.save()
+        if self.journal is not None:
+            self.journal.complete()
+        if program_state.resumed:
+            program_state.delete_state_file()
+        return RunResult(
+            output_playlist_id,
+            len(program_state.artists),
+            songs,
+            sync_stats,
+            self.pruning.as_dict() if self.pruning is not None else None,
+            self.catalog.as_dict(),
+        )
+
+    def _cached(self, key, crawl):
+        if self.artist_cache is None:
+            return crawl()
+        return self.artist_cache.get(key, crawl)
+
+    def _cached_albums(self, artist, include_groups):
+        return self._cached(
+            ("albums", include_groups, artist["id"]),
+            lambda: get_artist_albums(artist, self.sp, include_groups),
+        )
+
+    def _artist_albums(self, artist, include_groups):
+        # Listed once per artist, for both the crawl and the release index
+        key = (include_groups, artist["id"])
+        if key not in self._listed_albums:
+            self._listed_albums[key] = self._cached_albums(artist, include_groups)
+        return self._listed_albums[key]
+
+    def prefetch_artist(self, artist, songs_per_artist=None):
+        """
+        Fills the artist cache with what the crawl of the artist needs: its
+        top tracks and album listings, and its whole discography when more
+        than 10 songs per artist are wanted.
+        """
+        self._cached(
+            ("top", artist["id"]), lambda: get_artist_top_10_songs(artist, self.sp)
+        )
+        albums = self._cached_albums(artist, "album")
+        singles = self._cached_albums(artist, "single")
+        if songs_per_artist is not None and songs_per_artist > 10:
+            self._cached(
+                ("discography", artist["id"]),
+                lambda: self._crawl_discography(
+                    artist, albums=albums, singles=singles, progress=Progress()
+                ),
+            )
+
+    def _record_releases(self, artist):
+        albums = self._artist_albums(artist, "album")
+        albums = albums + self._artist_albums(artist, "single")
+        self.release_index.record(artist["id"], [album["id"] for album in albums])
+
+    def _crawl_discography(self, artist, albums=None, singles=None, progress=None):
+        """ Songs of the albums and singles of the artist, with their
+            popularity, in album order (select_songs ranks them)
+        """
+        if progress is None:
+            progress = self.progress
+        if albums is None:
+            albums = self._artist_albums(artist, "album")
+        if singles is None:
+            singles = self._artist_albums(artist, "single")
+        artist_songs = get_artist_songs(
+            artist,
+            self.sp,
+            include_groups="album",
+            progress_callback=progress.album_callback,
+            albums=albums,
+            catalog=self.catalog,
+        )
+        artist_songs.extend(
+            get_artist_songs(
+                artist,
+                self.sp,
+                include_groups="single",
+                progress_callback=progress.single_callback,
+                albums=singles,
+                catalog=self.catalog,
+            )
+        )
+        return get_songs_popularity(artist_songs, self.sp, self.catalog)
+
+    def _crawl_discography_pruned(self, artist, top_songs, songs_per_artist):
+        """
+        Songs of the albums and singles of the artist with their popularity,
+        like _crawl_discography, but only for the albums which may hold one
+        of the songs selected after the top songs.
+
+        Albums are ranked by their popularity (read through albums(), which
+        also gives their first page of tracks) and their songs looked up in
+        that order, until the songs kept so far are more popular than the
+        bound of the next album: its popularity plus `prune_slack`. The
+        songs the catalog knows are taken from it, the others are looked up
+        50 per tracks() request.
+        """
+        albums = [
+            album
+            for album in self._artist_albums(artist, "album")
+            + self._artist_albums(artist, "single")
+            if not is_unwanted_song_or_album(album["name"])
+        ]
+        albums_ids = {album["id"] for album in albums}
+        album_requests = -(
+            -(len(albums_ids) - len(self.catalog.full_albums(albums_ids))) // 20
+        )
+        full_albums = get_full_albums(albums, self.sp, self.catalog)
+        excluded_names = {song["name"] for song in top_songs}
+        needed = songs_per_artist - len(excluded_names)
+        ranking = sorted(
+            range(len(full_albums)), key=lambda i: -full_albums[i]["popularity"]
+        )
+
+        # Songs of every album, the ones of the pages an album object lacks
+        # can't be filtered without reading them
+        songs_count = sum(
+            len(remove_unwanted_songs(album["tracks"]["items"]))
+            + album["tracks"]["total"]
+            - len(album["tracks"]["items"])
+            for album in full_albums
+        )
+
+        page_requests = 0
+        album_songs = {}
+
+        best = {}  # most popular song looked up for every name not excluded
+        looked_up = []  # (album index, position in album, song)
+        # Songs to look up, their IDs unknown to the catalog and unique
+        pending = []
+        pending_ids = set()
+        # Songs of a pending ID, resolved from the catalog once it's looked up
+        waiting = []
+        tracks_requests = 0
+
+        def settled(album):
+            if needed <= 0:
+                return True
+            if len(best) < needed:
+                return False
+            return heapq.nlargest(needed, best.values())[-1] > (
+                album["popularity"] + self.prune_slack
+            )
+
+        def record(entries, songs):
+            for (i, position, _), song in zip(entries, songs):
+                looked_up.append((i, position, song))
+                if song["name"] not in excluded_names:
+                    best[song["name"]] = max(
+                        best.get(song["name"], song["popularity"]), song["popularity"]
+                    )
+
+        def look_up(count):
+            nonlocal tracks_requests
+            batch = pending[:count]
+            del pending[:count]
+            tracks_requests += 1
+            record(
+                batch,
+                get_songs_popularity([song for _, _, song in batch], self.sp, self.catalog),
+            )
+
+        def add_songs(i, songs):
+            missing = self.catalog.missing_tracks(song["id"] for song in songs)
+            known = []
+            for position, song in enumerate(songs):
+                entry = (i, position, song)
+                if song["id"] in pending_ids:
+                    waiting.append(entry)
+                elif song["id"] in missing:
+                    pending.append(entry)
+                    pending_ids.add(song["id"])
+                else:
+                    known.append(entry)
+            tracks = self.catalog.tracks(song["id"] for _, _, song in known)
+            record(known, [tracks[song["id"]] for _, _, song in known])
+
+        with trace_span("pruned crawl", artist=artist["name"], albums=len(full_albums)):
+            for i in ranking:
+                # Only the songs looked up count: the pending ones could only
+                # settle it sooner, and looking them up now would send a
+                # request with less than 50 songs
+                if settled(full_albums[i]):
+                    break
+                songs, requests = get_full_album_songs(
+                    full_albums[i], self.sp, self.catalog
+                )
+                page_requests += requests
+                album_songs[i] = songs
+                add_songs(i, songs)
+                while len(pending) >= 50:
+                    look_up(50)
+            while pending:
+                # The songs of an album settled since it was read can't be
+                # selected, like the ones of the albums not read
+                pending[:] = [entry for entry in pending if not settled(full_albums[entry[0]])]
+                if pending:
+                    look_up(50)
+            # The songs of an ID dropped above are dropped as well
+            tracks = self.catalog.tracks(song["id"] for _, _, song in waiting)
+            waiting = [entry for entry in waiting if entry[2]["id"] in tracks]
+            record(waiting, [tracks[song["id"]] for _, _, song in waiting])
+        self.catalog.avoided(max(0, -(-len(looked_up) // 50) - tracks_requests))
+
+        # Back to album order, which breaks the ties of the exact mode
+        looked_up.sort(key=lambda x: x[:2])
+        ranked_songs = [song for _, _, song in looked_up]
+
+        exact_page_requests, exact_tracks_requests = self._exact_requests(
+            full_albums, album_songs
+        )
+        self.pruning.add(
+            artists=1,
+            albums=len(full_albums),
+            albums_looked_up=len(album_songs),
+            songs=songs_count,
+            songs_looked_up=len(looked_up),
+            tracks_requests=tracks_requests,
+            exact_tracks_requests=exact_tracks_requests,
+            requests=album_requests + page_requests + tracks_requests,
+            exact_requests=exact_page_requests + exact_tracks_requests,
+        )
+
+        if self.prune_audit_every > 0 and self.pruning.artists % self.prune_audit_every == 0:
+            self._audit_pruning(
+                full_albums, album_songs, ranked_songs, top_songs, songs_per_artist
+            )
+        return ranked_songs
+
+    def _exact_requests(self, full_albums, album_songs):
+        """
+        Requests the exact mode sends to list the albums and look up their
+        songs, as (album_tracks/next requests, tracks() requests). They are
+        counted against the catalog an exact run would have filled so far,
+        which this adds the albums and songs to.
+
+        Songs beyond the first page of an album not read here (albums of
+        more than 50 tracks) are unknown: they count as new songs, unwanted
+        ones included, so for such albums the count is an upper bound.
+        """
+        exact_catalog = self._exact_catalog
+        unique_albums = {}
+        for i, album in enumerate(full_albums):
+            unique_albums.setdefault(album["id"], i)
+        unlisted = exact_catalog.missing_album_songs(unique_albums)
+        page_requests = 0
+        songs = {}
+        unseen_songs = 0
+        for album_id, i in unique_albums.items():
+            if album_id not in unlisted:
+                continue
+            album = full_albums[i]
+            page_requests += max(1, -(-album["tracks"]["total"] // 50))
+            if i in album_songs:
+                album_songs_known = album_songs[i]
+            else:
+                album_songs_known = remove_unwanted_songs(album["tracks"]["items"])
+                unseen_songs += album["tracks"]["total"] - len(album["tracks"]["items"])
+            exact_catalog.add_album_songs(album_id, album_songs_known, 0)
+            songs.update((song["id"], song) for song in album_songs_known)
+        missing = exact_catalog.missing_tracks(songs)
+        exact_catalog.add_tracks(songs)
+        return page_requests, -(-(len(missing) + unseen_songs) // 50)
+
+    def _audit_pruning(
+        self, full_albums, album_songs, ranked_songs, top_songs, songs_per_artist
+    ):
+        """ Compares the songs selected from the pruned discography with the
+            ones the exact mode selects
+        """
+        songs = []
+        for i, album in enumerate(full_albums):
+            if i not in album_songs:
+                album_songs[i] = get_full_album_songs(album, self.sp, self.catalog)[0]
+            songs.extend(album_songs[i])
+        exact_songs = get_songs_popularity(songs, self.sp, self.catalog)
+
+        exact = select_songs(top_songs, exact_songs, songs_per_artist)
+        pruned_ids = {
+            song["id"] for song in select_songs(top_songs, ranked_songs, songs_per_artist)
+        }
+        self.pruning.add(
+            audited_artists=1,
+            audited_songs=len(exact),
+            audited_matches=sum(1 for song in exact if song["id"] in pruned_ids),
+        )
+
+    def _candidate_songs(self, artist, songs_per_artist):
+        """ Top 10 songs of the artist and, if more songs are wanted, the
+            rest of its discography to be ranked by popularity after them
+        """
+        self._listed_albums = {}
+        top_10_songs = self._cached(
+            ("top", artist["id"]),
+            lambda: get_artist_top_10_songs(artist, self.sp),
+        )
+        # Full track objects, their popularity needn't be looked up again
+        self.catalog.add_tracks({song["id"]: song for song in top_10_songs})
+        if self._exact_catalog is not None:
+            self._exact_catalog.add_tracks({song["id"]: song for song in top_10_songs})
+        ranked_songs = []
+        if songs_per_artist > 10 and self.pruning is not None:
+            ranked_songs = self._cached(
+                ("pruned discography", artist["id"], songs_per_artist, self.prune_slack),
+                lambda: self._crawl_discography_pruned(
+                    artist, top_10_songs, songs_per_artist
+                ),
+            )
+        elif songs_per_artist > 10:
+            ranked_songs = self._cached(
+                ("discography", artist["id"]),
+                lambda: self._crawl_discography(artist),
+            )
+        if self.release_index is not None:
+            self._record_releases(artist)
+        return top_10_songs, ranked_songs
+
+    def _new_release_songs(self, artist, known_album_ids):
+        """ Songs of the releases of the artist missing from known_album_ids,
+            with their popularity
+        """
+        albums = get_artist_albums(
+            artist, self.sp, "album", known_album_ids=known_album_ids
+        )
+        singles = get_artist_albums(
+            artist, self.sp, "single", known_album_ids=known_album_ids
+        )
+        self.release_index.record(
+            artist["id"], [album["id"] for album in albums + singles]
+        )
+        if len(albums) == 0 and len(singles) == 0:
+            return []
+        return self._crawl_discography(artist, albums=albums, singles=singles)
+
+    def _insert_songs(self, output_playlist_id, uris, position):
+        while len(uris) > 0:
+            try:
+                with trace_span("write", items=len(uris)):
+                    make_request(
+                        self.sp,
+                        self.sp.playlist_add_items,
+                        output_playlist_id,
+                        uris,
+                        position=position,
+                    )
+                return
+            except SpotifyPartialWriteException as e:
+                # Nothing written: make_request already retried what could
+                # be retried, the error is final
+                if e.committed == 0:
+                    raise
+                uris = uris[e.committed :]
+                position += e.committed
+
+    def _make_room(self, block, new_songs, songs_per_artist):
+        """
+        Ranks the new songs of an artist with its songs already in the
+        playlist (`block`, as (position, track)), keeping the
+        `songs_per_artist` most popular ones, the songs already there first
+        on ties. Returns the new songs to add and the block entries to remove.
+        """
+        if len(block) + len(new_songs) <= songs_per_artist:
+            return new_songs, []
+        ranked = sorted(
+            [(-track["popularity"], 0, i) for i, (_, track) in enumerate(block)]
+            + [(-song["popularity"], 1, i) for i, song in enumerate(new_songs)]
+        )[:songs_per_artist]
+        kept_old = {i for _, is_new, i in ranked if not is_new}
+        kept_new = {i for _, is_new, i in ranked if is_new}
+        return (
+            [song for i, song in enumerate(new_songs) if i in kept_new],
+            [entry for i, entry in enumerate(block) if i not in kept_old],
+        )
+
+    def _remove_songs(self, output_playlist_id, entries):
+        """ Removes the (position, track) entries, positions being current """
+        # From the end of the playlist, so that the next positions stay valid
+        entries = sorted(entries, key=lambda entry: entry[0], reverse=True)
+        chunk_size = self.sp.max_playlist_items_per_request
+        for i in range(0, len(entries), chunk_size):
+            chunk = entries[i : i + chunk_size]
+            with trace_span("remove", items=len(chunk)):
+                make_request(
+                    self.sp,
+                    self.sp.playlist_remove_specific_occurrences_of_items,
+                    output_playlist_id,
+                    [
+                        {"uri": track["uri"], "positions": [position]}
+                        for position, track in chunk
+                    ],
+                )
+
+    def _update_incrementally(self, artists, songs_per_artist, output_playlist_id):
+        """
+        Adds the songs of the releases published since the last run right
+        after the songs of their artist already in the playlist, which keeps
+        its order by artist. An artist keeps at most `songs_per_artist`
+        songs: when the new ones don't fit, the least popular of its songs,
+        old or new, are left out. Artists missing from the release index are
+        crawled like in a full run.
+        """
+        progress = self.progress
+        self.profile_stage("crawl")
+        with trace_span("output playlist"):
+            playlist_tracks = get_playlist_tracks(output_playlist_id, self.sp)
+
+        # Songs of every artist already in the playlist, as (position, track)
+        artists_ids = {artist["id"] for artist in artists}
+        blocks = {}
+        for position, item in enumerate(playlist_tracks):
+            track = item["track"]
+            if track is None:
+                continue
+            for track_artist in track["artists"]:
+                if track_artist["id"] in artists_ids:
+                    blocks.setdefault(track_artist["id"], []).append((position, track))
+                    break
+
+        added_songs = []
+        # Songs inserted minus songs removed before the current artist
+        shift = 0
+        position = 0
+        for artist in artists:
+            with trace_span("artist", artist=artist["name"]):
+                progress.current_artist += 1
+
+                known_album_ids = self.release_index.known_albums(artist["id"])
+                top_songs, ranked_songs = [], []
+                if known_album_ids is None:
+                    top_songs, ranked_songs = self._candidate_songs(
+                        artist, songs_per_artist
+                    )
+                elif not self.release_index.is_fresh(artist["id"]):
+                    ranked_songs = self._new_release_songs(artist, known_album_ids)
+
+                block = blocks.get(artist["id"], [])
+                songs = select_songs(
+                    top_songs,
+                    ranked_songs,
+                    songs_per_artist,
+                    excluded_names={track["name"] for _, track in block},
+                )
+                songs, removed = self._make_room(block, songs, songs_per_artist)
+
+                if len(block) > 0:
+                    if len(removed) > 0:
+                        self._remove_songs(
+                            output_playlist_id,
+                            [(p + shift, track) for p, track in removed],
+                        )
+                    # Right after the last song of the artist
+                    position = block[-1][0] + 1 + shift - len(removed)
+                    shift -= len(removed)
+                if len(songs) > 0:
+                    self._insert_songs(
+                        output_playlist_id, [song["uri"] for song in songs], position
+                    )
+                    shift += len(songs)
+                    position += len(songs)
+
+                added_songs.extend(songs)
+                progress.update(1)
+                self._update_metrics(progress.current_artist, len(added_songs), 0)
+
+        return added_songs
+
+    def _select_artist_songs(self, artist, songs_per_artist):
+        top_songs, ranked_songs = self._candidate_songs(artist, songs_per_artist)
+        with trace_span("selection", songs=len(top_songs) + len(ranked_songs)):
+            return select_songs(top_songs, ranked_songs, songs_per_artist)
+
+    def _sync(self, artists, songs_per_artist, output_playlist_id):
+        """
+        Selects the songs of every artist, then turns the output playlist
+        into that selection with as few writes as possible.
+        """
+        progress = self.progress
+        self.profile_stage("crawl")
+        songs = []
+        for artist in artists:
+            with trace_span("artist", artist=artist["name"]):
+                progress.current_artist += 1
+                songs.extend(self._select_artist_songs(artist, songs_per_artist))
+                progress.update(1)
+                self._update_metrics(progress.current_artist, len(songs), len(songs))
+
+        self.profile_stage("sync")
+        with trace_span("sync", songs=len(songs)):
+            sync_stats = make_request(
+                self.sp,
+                sync_playlist,
+                self.sp,
+                output_playlist_id,
+                [song["uri"] for song in songs],
+            )
+        self._update_metrics(progress.current_artist, len(songs), 0)
+        return songs, sync_stats
+
+    def _on_batch_committed(self, count, tag):
+        # Called from the playlist writer thread
+        if self.journal is not None:
+            self.journal.record_write(count)
+        if tag is not None:
+            artist_index, song_id = tag
+            self.program_state.set_last_artist_saved(artist_index)
+            self.program_state.last_song_saved_id = song_id
+            self.program_state.last_updated_at = datetime.datetime.now()
+
+    def _crawl(
+        self,
+        artists,
+        songs_per_artist,
+        output_playlist_id,
+        artist_offset=0,
+        write_position=None,
+    ):
+        program_state = self.program_state
+        progress = self.progress
+        journal = self.journal
+        total_songs = []
+        writer = PlaylistWriter(
+            self.sp,
+            output_playlist_id,
+            position=write_position,
+            on_commit=self._on_batch_committed,
+        )
+        try:
+            if journal is not None:
+                # Songs selected before the run was interrupted
+                total_songs = [
+                    {"id": uri.rsplit(":", 1)[-1], "uri": uri}
+                    for uri in journal.selected_uris
+                ]
+                for uri in journal.pending_uris:
+                    writer.add(uri)
+            # The song the state was saved at, read once: the writer thread
+            # overwrites program_state.last_song_saved_id on every batch
+            resume_song_id = (
+                program_state.last_song_saved_id if program_state.resumed else None
+            )
+            self.profile_stage("crawl")
+
+            for artist_index, artist in enumerate(artists, start=artist_offset):
+                if journal is not None and artist["id"] in journal.completed_artists:
+                    progress.current_artist += 1
+                    continue
+                with trace_span("artist", artist=artist["name"]):
+                    progress.current_artist += 1
+
+                    final_artist_songs = self._select_artist_songs(
+                        artist, songs_per_artist
+                    )
+
+                    # Only the artist the state was saved at was partly written
+                    if artist_index == artist_offset and resume_song_id is not None:
+                        for i, song in enumerate(final_artist_songs):
+                            if song["id"] == resume_song_id:
+                                # remove all songs before the last saved song (included)
+                                final_artist_songs = final_artist_songs[i + 1 :]
+                                break
+                    if journal is not None:
+                        journal.artist_done(
+                            artist["id"], [song["uri"] for song in final_artist_songs]
+                        )
+                    for song in final_artist_songs:
+                        writer.add(song["uri"], (artist_index, song["id"]))
+
+                    total_songs.extend(final_artist_songs)
+                    progress.update(1)
+                    self._update_metrics(
+                        progress.current_artist, len(total_songs), writer.pending
+                    )
+
+            # add the remaining songs
+            self.profile_stage("final write")
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        self._update_metrics(progress.current_artist, len(total_songs), 0)
+
+        return total_songs
 
 def find_state_files():
     return [
-        f for f in os.listdir(".") if os.path.isfile(f) and f.endswith("_state.json")
+        f
+        for f in os.listdir(".")
+        if os.path.isfile(f) and f.endswith(("_state.bin", "_state.json"))
     ]
 
 
-def main():
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate an explore playlist without any prompt"
+    )
+    parser.add_argument(
+        "source_playlist_id",
+        nargs="?",
+        help="ID of the playlist whose artists are explored",
+    )
+    parser.add_argument(
+        "--songs-per-artist",
+        type=int,
+        default=10,
+        help="maximum number of songs kept per artist (default: 10)",
+    )
+    parser.add_argument("--output-name", help="name of the playlist to create")
+    parser.add_argument(
+        "--output-playlist-id", help="fill this existing playlist instead"
+    )
+    parser.add_argument(
+        "--include-followed-artists",
+        action="store_true",
+        help="also explore the artists followed by the user",
+    )
+    parser.add_argument(
+        "--public", action="store_true", help="create a public playlist"
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="STATE_FILE",
+        help="resume the run saved in this _state.json file",
+    )
+    parser.add_argument(
+        "--releases",
+        metavar="INDEX_JSON",
+        help="record the albums seen per artist in this file "
+        "(default with --output-playlist-id: <output playlist id>_releases.json)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only add the songs released since the last run to --output-playlist-id, "
+        "replacing the least popular songs of artists which already have "
+        "--songs-per-artist songs",
+    )
+    parser.add_argument(
+        "--sync",
+        action="store_true",
+        help="only write the differences with the current --output-playlist-id",
+    )
+    parser.add_argument(
+        "--stream-artists",
+        action="store_true",
+        help="start crawling while the source playlist is read, exploring its "
+        "artists in playlist order instead of by name",
+    )
+    parser.add_argument(
+        "--prune",
+        type=int,
+        metavar="SLACK",
+        help="only look up the popularity of the songs of the most popular albums, "
+        "assuming no song is more than SLACK points more popular than its album",
+    )
+    parser.add_argument(
+        "--prune-audit",
+        type=int,
+        default=0,
+        metavar="N",
+        help="with --prune, also crawl one artist out of N in the exact mode and "
+        "report the selected songs the pruning missed",
+    )
+    parser.add_argument(
+        "--recheck-after",
+        type=float,
+        default=0,
+        metavar="HOURS",
+        help="with --incremental, skip the artists checked less than HOURS ago",
+    )
+    parser.add_argument(
+        "--sources",
+        metavar="SOURCES_JSON",
+        default=SOURCE_CACHE_FILE,
+        help="artists of the source playlists by snapshot_id, reused while a "
+        f"playlist doesn't change (default: {SOURCE_CACHE_FILE})",
+    )
+    parser.add_argument(
+        "--journal",
+        metavar="JOURNAL_JSONL",
+        help="checkpoint the run in this journal, or resume the run it holds",
+    )
+    parser.add_argument(
+        "--migrate-state",
+        metavar="STATE_JSON",
+        action="append",
+        help="convert a _state.json file to the current state format and exit "
+        "(can be repeated)",
+    )
+    args = parser.parse_args(argv)
+    if args.migrate_state:
+        return args
+    if args.incremental and args.output_playlist_id is None:
+        parser.error("--incremental requires --output-playlist-id")
+    if args.sync and args.output_playlist_id is None:
+        parser.error("--sync requires --output-playlist-id")
+    if args.sync and args.incremental:
+        parser.error("--sync and --incremental can't be used together")
+    if args.stream_artists and (args.sync or args.incremental):
+        parser.error("--stream-artists can't be used with --sync or --incremental")
+    resuming_journal = args.journal is not None and os.path.exists(args.journal)
+    if args.resume is None and not resuming_journal:
+        if args.source_playlist_id is None:
+            parser.error("a source playlist ID is required unless --resume is used")
+        if args.output_name is None and args.output_playlist_id is None:
+            parser.error("--output-name or --output-playlist-id is required")
+        if args.songs_per_artist < 1:
+            parser.error("--songs-per-artist must be greater than 0")
+    return args
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.migrate_state:
+        for filename in args.migrate_state:
+            print(f"{filename} migrated to {migrate_state_file(filename)}")
+        return
+
     load_dotenv()
     pg = PlaylistGenerator(
         os.getenv("SPOTIPY_CLIENT_ID"),
         os.getenv("SPOTIPY_CLIENT_SECRET"),
         os.getenv("SPOTIPY_REDIRECT_URI"),
+        source_cache=SourcePlaylistCache(args.sources),
     )
-    state_files = find_state_files()
-    if len(state_files) == 1:
-        print(f"Found state file: {state_files[0]}")
-        while True:
-            try:
-                choice = input("Do you want to load this state file? (y/n) ").lower()
-                if choice == "y":
-                    pg.state.load_from_file(state_files[0])
-                    break
-                elif choice == "n":
-                    break
-                else:
-                    raise ValueError
-            except ValueError:
-                print("Invalid choice. Please try again.")
 
-    elif len(state_files) > 1:
-        print(f"Found multiple state files:")
-        for i, f in enumerate(state_files):
-            print(f"[{i}]  {f}")
-        while True:
-            try:
-                choice = input(
-                    "If you want to load a state file, type the number of the file you want to load. Otherwise, press enter. "
-                )
-                if choice == "":
-                    break
-                choice = int(choice)
-                if choice < 0 or choice >= len(state_files):
-                    raise ValueError
-                pg.state.load_from_file(state_files[choice])
-                break
-            except ValueError:
-                print("Invalid choice. Please try again.")
+    state = None
+    if args.resume is not None:
+        state = ProgramState()
+        state.load_state_from_file(args.resume)
+
+    journal = None
+    if args.journal is not None:
+        journal = CheckpointJournal(args.journal)
 
-    print(pg.state.__dict__)
+    release_index = None
+    releases_path = args.releases
+    if releases_path is None and args.output_playlist_id is not None:
+        releases_path = f"{args.output_playlist_id}_releases.json"
+    if releases_path is not None:
+        release_index = ReleaseIndex(
+            releases_path, recheck_after=args.recheck_after * 60 * 60
+        )
+
+    try:
+        result = pg.run(
+            RunConfig(
+                source_playlist_id=args.source_playlist_id,
+                songs_per_artist=args.songs_per_artist,
+                output_playlist_name=args.output_name,
+                output_playlist_id=args.output_playlist_id,
+                include_followed_artists=args.include_followed_artists,
+                public=args.public,
+                state=state,
+                release_index=release_index,
+                incremental=args.incremental,
+                journal=journal,
+                sync=args.sync,
+                stream_artists=args.stream_artists,
+                prune_slack=args.prune,
+                prune_audit_every=args.prune_audit,
+            )
+        )
+    except KeyboardInterrupt:
+        if journal is not None:
+            journal.close()
+            print(f"Interrupted, resume with --journal {journal.path}")
+        elif args.stream_artists:
+            print("Interrupted, a run streaming its artists needs --journal to be resumed")
+        else:
+            pg.program_state.save_state()
+            print(f"Interrupted, state saved to {pg.program_state.filename}")
+        sys.exit(1)
+
+    print(
+        f"Playlist {result.output_playlist_id} filled with {len(result.songs)} songs "
+        f"from {result.artists_count} artists"
+    )
+    if result.sync_stats is not None:
+        print(
+            "{action} with {requests} write requests: {removed} removed, "
+            "{moved} moved, {added} added".format(
+                action="Rebuilt" if result.sync_stats["rebuilt"] else "Synced",
+                **result.sync_stats,
+            )
+        )
+    print(
+        "{requests_avoided} requests avoided by reusing {album_hits} album listings "
+        "and {track_hits} track lookups".format(**result.catalog_stats)
+    )
+    if result.pruning_stats is not None:
+        stats = result.pruning_stats
+        print(
+            "Pruning: {albums_looked_up}/{albums} albums and {songs_looked_up}/{songs} "
+            "songs looked up, {tracks_requests} tracks requests instead of "
+            "{exact_tracks_requests}, {requests} requests instead of "
+            "{exact_requests}".format(**stats)
+        )
+        if stats["audit_recall"] is not None:
+            print(
+                f"Audit of {stats['audited_artists']} artists: "
+                f"{stats['audited_matches']}/{stats['audited_songs']} songs of the "
+                f"exact mode selected ({stats['audit_recall']:.1%})"
+            )
 
 
 if __name__ == "__main__":
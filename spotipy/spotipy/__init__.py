@@ -1,5 +1,54 @@
-from .cache_handler import *  # noqa
-from .client import *  # noqa
-from .exceptions import *  # noqa
-from .oauth2 import *  # noqa
-from .util import *  # noqa
+# Names are resolved on first access, so that `import spotipy` stays cheap
+# and e.g. requests or the OAuth machinery are only imported when used.
+_exports = {
+    "cache_handler": [
+        "CacheHandler",
+        "CacheFileHandler",
+        "SharedCacheFileHandler",
+        "DjangoSessionCacheHandler",
+        "FlaskSessionCacheHandler",
+        "MemoryCacheHandler",
+        "RedisCacheHandler",
+        "RedisNearCacheHandler",
+        "MemcacheCacheHandler",
+    ],
+    "catalog_cache": ["CatalogCache"],
+    "client": ["Spotify"],
+    "exceptions": ["SpotifyException", "SpotifyPartialWriteException"],
+    "playlist_sync": ["plan_playlist_sync", "sync_playlist"],
+    "oauth2": [
+        "SpotifyClientCredentials",
+        "SpotifyOAuth",
+        "SpotifyOauthError",
+        "SpotifyStateError",
+        "SpotifyImplicitGrant",
+        "SpotifyPKCE",
+    ],
+    "ratelimit": ["RateLimiter"],
+    "registry": ["ClientRegistry"],
+    "session": ["SessionRegistry", "build_session"],
+    "util": ["CLIENT_CREDS_ENV_VARS", "prompt_for_user_token"],
+}
+
+_modules_by_name = {
+    name: module for module, names in _exports.items() for name in names
+}
+
+__all__ = list(_modules_by_name)
+
+
+def __getattr__(name):
+    import importlib
+
+    if name in _modules_by_name:
+        module = importlib.import_module(f"{__name__}.{_modules_by_name[name]}")
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    if name in _exports:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,61 @@
+""" Local HTTP server receiving the authorization code of OAuth flows
+
+    Imported lazily by spotipy.oauth2, only when a user has to authorize
+    the app through the browser.
+"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from spotipy.oauth2 import SpotifyOAuth, SpotifyOauthError
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.auth_code = self.server.error = None
+        try:
+            state, auth_code = SpotifyOAuth.parse_auth_response_url(self.path)
+            self.server.state = state
+            self.server.auth_code = auth_code
+        except SpotifyOauthError as error:
+            self.server.error = error
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.end_headers()
+
+        if self.server.auth_code:
+            status = "successful"
+        elif self.server.error:
+            status = f"failed ({self.server.error})"
+        else:
+            self._write("<html><body><h1>Invalid request</h1></body></html>")
+            return
+
+        self._write("""<html>
+<script>
+window.close()
+</script>
+<body>
+<h1>Authentication status: {}</h1>
+This window can be closed.
+<script>
+window.close()
+</script>
+<button class="closeButton" style="cursor: pointer" onclick="window.close();">Close Window</button>
+</body>
+</html>""".format(status))
+
+    def _write(self, text):
+        return self.wfile.write(text.encode("utf-8"))
+
+    def log_message(self, format, *args):
+        return
+
+
+def start_local_http_server(port, handler=None):
+    server = HTTPServer(("127.0.0.1", port), handler or RequestHandler)
+    server.allow_reuse_address = True
+    server.auth_code = None
+    server.auth_token_form = None
+    server.error = None
+    return server
@@ -1,22 +1,53 @@
 __all__ = [
     'CacheHandler',
     'CacheFileHandler',
+    'SharedCacheFileHandler',
     'DjangoSessionCacheHandler',
     'FlaskSessionCacheHandler',
     'MemoryCacheHandler',
     'RedisCacheHandler',
+    'RedisNearCacheHandler',
     'MemcacheCacheHandler']
 
 import errno
 import json
 import logging
 import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
 from spotipy.util import CLIENT_CREDS_ENV_VARS
 
-from redis import RedisError
-
 logger = logging.getLogger(__name__)
 
+try:
+    import fcntl
+
+    def _lock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _unlock_file(f):
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+except ImportError:  # Windows
+    import msvcrt
+
+    def _lock_file(f):
+        f.seek(0)
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK only retries for 10 seconds
+                continue
+
+    def _unlock_file(f):
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
 
 class CacheHandler():
     """
@@ -42,6 +73,14 @@ class CacheHandler():
         raise NotImplementedError()
         return None
 
+    def refresh_lock(self):
+        """
+        Return a context manager held by auth managers while they check,
+        refresh and save a token. Handlers shared between processes can
+        override it so that only one of them refreshes the token.
+        """
+        return nullcontext()
+
 
 class CacheFileHandler(CacheHandler):
     """
@@ -99,6 +138,115 @@ class CacheFileHandler(CacheHandler):
                            self.cache_path)
 
 
+class SharedCacheFileHandler(CacheFileHandler):
+    """
+    A `CacheFileHandler` which can be shared by several processes using
+    the same cache path.
+
+    Tokens are written to a temporary file which is then renamed over the
+    cache, so readers never see a partially written file. Refreshes are
+    serialized with an advisory lock on `<cache_path>.lock`, so N processes
+    only refresh the token once per expiry. The cache is only parsed again
+    when the file actually changed on disk.
+    """
+
+    def __init__(self,
+                 cache_path=None,
+                 username=None,
+                 encoder_cls=None,
+                 lock_path=None):
+        """
+        Parameters:
+             * cache_path: See `CacheFileHandler`
+             * username: See `CacheFileHandler`
+             * encoder_cls: See `CacheFileHandler`
+             * lock_path: May be supplied, will otherwise be `<cache_path>.lock`
+        """
+        super().__init__(cache_path=cache_path, username=username, encoder_cls=encoder_cls)
+        self.lock_path = lock_path or self.cache_path + ".lock"
+        # Held during a whole refresh, with the advisory lock
+        self._refresh_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+        # Only guards the parsed cache, so readers don't wait for a refresh
+        self._cache_lock = threading.Lock()
+        self._file_signature = None
+        self._token_info = None
+
+    @contextmanager
+    def refresh_lock(self):
+        # Reentrant, as save_token_to_cache takes it again during a refresh
+        with self._refresh_lock:
+            if self._lock_depth == 0:
+                self._lock_file = open(self.lock_path, "a+")
+                _lock_file(self._lock_file)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0:
+                    _unlock_file(self._lock_file)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    @staticmethod
+    def _signature(stat):
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def get_cached_token(self):
+        try:
+            signature = self._signature(os.stat(self.cache_path))
+        except OSError as error:
+            if error.errno == errno.ENOENT:
+                logger.debug("cache does not exist at: %s", self.cache_path)
+            else:
+                logger.warning("Couldn't read cache at: %s", self.cache_path)
+            return None
+
+        with self._cache_lock:
+            if signature == self._file_signature:
+                return self._token_info
+
+            try:
+                with open(self.cache_path) as f:
+                    token_info = json.load(f)
+                    signature = self._signature(os.fstat(f.fileno()))
+            except OSError:
+                logger.warning("Couldn't read cache at: %s", self.cache_path)
+                return None
+            except ValueError:
+                logger.warning("Couldn't decode the cache at: %s", self.cache_path)
+                return None
+
+            self._file_signature = signature
+            self._token_info = token_info
+            return token_info
+
+    def save_token_to_cache(self, token_info):
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        try:
+            with self.refresh_lock():
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=directory, prefix=os.path.basename(self.cache_path) + "."
+                )
+                try:
+                    with os.fdopen(fd, "w") as f:
+                        f.write(json.dumps(token_info, cls=self.encoder_cls))
+                        f.flush()
+                        os.fsync(f.fileno())
+                    os.replace(tmp_path, self.cache_path)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+                with self._cache_lock:
+                    self._file_signature = self._signature(os.stat(self.cache_path))
+                    self._token_info = token_info
+        except OSError:
+            logger.warning('Couldn\'t write token to cache at: %s',
+                           self.cache_path)
+
+
 class MemoryCacheHandler(CacheHandler):
     """
     A cache handler that simply stores the token info in memory as an
@@ -194,6 +342,7 @@ class RedisCacheHandler(CacheHandler):
         self.key = key if key else 'token_info'
 
     def get_cached_token(self):
+        from redis import RedisError
         token_info = None
         try:
             token_info = self.redis.get(self.key)
@@ -205,10 +354,164 @@ class RedisCacheHandler(CacheHandler):
         return token_info
 
     def save_token_to_cache(self, token_info):
+        from redis import RedisError
+        try:
+            self.redis.set(self.key, json.dumps(token_info))
+        except RedisError as e:
+            logger.warning('Error saving token to cache: ' + str(e))
+
+
+class RedisNearCacheHandler(RedisCacheHandler):
+    """
+    A Redis cache handler keeping a process-local copy of the token.
+
+    The local copy is used until `near_cache_margin` seconds before the
+    token expires, so most lookups don't hit Redis at all. When another
+    node saves a new token, the local copies can be invalidated through
+    pub/sub or keyspace notifications. Refreshes can also be serialized
+    across nodes with a Redis lock.
+    """
+
+    def __init__(self,
+                 redis=None,
+                 key=None,
+                 url=None,
+                 max_connections=None,
+                 connection_pool=None,
+                 near_cache_margin=60,
+                 invalidation=None,
+                 distributed_lock=False,
+                 lock_timeout=30):
+        """
+        Parameters:
+            * redis: Redis object provided by redis-py library. Optional if
+              `connection_pool` or `url` is given.
+            * key: May be supplied, will otherwise be generated
+                   (takes precedence over `token_info`)
+            * url: Redis URL used to build a connection pool
+                   (e.g. "redis://localhost:6379/0")
+            * max_connections: Maximum size of the pool built from `url`
+            * connection_pool: A redis-py ConnectionPool shared with other clients
+            * near_cache_margin: How many seconds before expiry the local copy
+                                 stops being used. Auth managers refresh tokens
+                                 60 seconds before expiry, so it shouldn't be lower.
+            * invalidation: None, "pubsub" to publish and listen to saves on the
+                            `<key>:invalidate` channel, or "keyspace" to listen to
+                            keyspace notifications (which must be enabled on the
+                            server with `notify-keyspace-events K$`)
+            * distributed_lock: Hold a Redis lock while refreshing the token, so
+                                that a single node refreshes it. redis-py's lock
+                                runs Lua scripts, which the server (or fakeredis)
+                                must support
+            * lock_timeout: Seconds after which the Redis lock is released
+                            even if its owner died
+        """
+        if redis is None:
+            import redis as redis_py
+            if connection_pool is None:
+                if url is None:
+                    raise ValueError("One of redis, connection_pool or url must be supplied")
+                connection_pool = redis_py.ConnectionPool.from_url(
+                    url, max_connections=max_connections
+                )
+            redis = redis_py.Redis(connection_pool=connection_pool)
+        super().__init__(redis, key)
+        self.near_cache_margin = near_cache_margin
+        self.distributed_lock = distributed_lock
+        self.lock_timeout = lock_timeout
+        self.invalidation = invalidation
+        self.invalidation_channel = self.key + ":invalidate"
+        # Sent along invalidations, so that we don't drop our own saves
+        self._instance_id = uuid.uuid4().hex
+        # Keyspace notifications don't say who wrote the key: as many "set"
+        # events as we have saves in flight are skipped. If another node's
+        # save lands first, its event is skipped and ours invalidates instead
+        self._own_sets = 0
+        self._lock = threading.Lock()
+        self._token_info = None
+        self._pubsub_thread = None
+        if invalidation is not None:
+            self._listen_for_invalidations(invalidation)
+
+    def _listen_for_invalidations(self, invalidation):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        if invalidation == "pubsub":
+            pubsub.subscribe(**{self.invalidation_channel: self._on_invalidation})
+        elif invalidation == "keyspace":
+            db = self.redis.connection_pool.connection_kwargs.get("db", 0)
+            pubsub.subscribe(**{f"__keyspace@{db}__:{self.key}": self._on_invalidation})
+        else:
+            raise ValueError(f"Unsupported invalidation: {invalidation}")
+        self._pubsub_thread = pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def _on_invalidation(self, message):
+        data = message.get("data")
+        if isinstance(data, bytes):
+            data = data.decode()
+        if self.invalidation == "keyspace":
+            with self._lock:
+                if data == "set" and self._own_sets > 0:
+                    self._own_sets -= 1
+                    return
+        elif data == self._instance_id:
+            return
+        self.invalidate()
+
+    def invalidate(self):
+        """ Drops the local copy, the next lookup will go to Redis """
+        with self._lock:
+            self._token_info = None
+
+    def close(self):
+        """ Stops listening for invalidations """
+        if self._pubsub_thread is not None:
+            self._pubsub_thread.stop()
+            self._pubsub_thread = None
+
+    def _is_usable(self, token_info):
+        return (
+            token_info is not None
+            and "expires_at" in token_info
+            and token_info["expires_at"] - self.near_cache_margin > time.time()
+        )
+
+    def get_cached_token(self):
+        with self._lock:
+            if self._is_usable(self._token_info):
+                return self._token_info
+
+        token_info = super().get_cached_token()
+        with self._lock:
+            if self._is_usable(token_info):
+                self._token_info = token_info
+        return token_info
+
+    def save_token_to_cache(self, token_info):
+        from redis import RedisError
+        keyspace = self.invalidation == "keyspace"
+        with self._lock:
+            self._token_info = token_info
+            if keyspace:
+                self._own_sets += 1
         try:
             self.redis.set(self.key, json.dumps(token_info))
         except RedisError as e:
+            if keyspace:
+                with self._lock:
+                    self._own_sets -= 1
             logger.warning('Error saving token to cache: ' + str(e))
+            return
+        if self.invalidation != "pubsub":
+            return
+        try:
+            self.redis.publish(self.invalidation_channel, self._instance_id)
+        except RedisError as e:
+            logger.warning('Error publishing token invalidation: ' + str(e))
+
+    def refresh_lock(self):
+        if not self.distributed_lock:
+            return nullcontext()
+        return self.redis.lock(self.key + ":lock", timeout=self.lock_timeout)
 
 
 class MemcacheCacheHandler(CacheHandler):
@@ -0,0 +1,77 @@
+""" In-memory cache of Spotify catalog responses """
+
+__all__ = ["CatalogCache"]
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+
+class CatalogCache:
+    """
+    Thread-safe LRU cache of GET responses of catalog endpoints (albums,
+    artists, tracks, ...), which are the same for every user and can
+    therefore be shared by all the clients of a process.
+
+    Responses are stored as JSON text, so callers get a fresh copy which
+    they may modify without altering the cache.
+    """
+
+    # Relative to https://api.spotify.com/v1/
+    CATALOG_PATHS = re.compile(
+        r"^(albums|artists|tracks|shows|episodes|audiobooks|chapters)(/|\?|$)"
+    )
+
+    def __init__(self, max_entries=10000, ttl=24 * 60 * 60):
+        """
+        Parameters:
+            * max_entries: Number of responses kept, least recently used
+                           ones are dropped first
+            * ttl: Seconds after which a response is fetched again
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def is_cacheable(self, method, path):
+        return method == "GET" and self.CATALOG_PATHS.match(path) is not None
+
+    @staticmethod
+    def key(path, params):
+        params = sorted((k, v) for k, v in (params or {}).items() if v is not None)
+        return path + "#" + urlencode(params)
+
+    def get(self, key):
+        """ Returns the cached response, or None """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            text = entry[1]
+        return json.loads(text)
+
+    def set(self, key, text):
+        """ Stores the JSON text of a response """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -5,17 +5,25 @@ __all__ = ["Spotify", "SpotifyException"]
 import json
 import logging
 import re
+import time
 import warnings
 
 import requests
 
-from spotipy.exceptions import SpotifyException
-from spotipy.util import Retry
+from spotipy.exceptions import SpotifyException, SpotifyPartialWriteException
+from spotipy.session import build_session
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 
 logger = logging.getLogger(__name__)
 
+# Passed to every request listener once a call to the Web API completes.
+# `status` is None when no HTTP response was received, `start` is a
+# `time.time()` timestamp and `duration` is expressed in seconds.
+RequestEvent = namedtuple(
+    "RequestEvent", ["method", "url", "status", "start", "duration"]
+)
+
 
 class Spotify:
     """
@@ -34,6 +42,8 @@ class Spotify:
     """
     max_retries = 3
     default_retry_codes = (429, 500, 502, 503, 504)
+    # Most items the playlist endpoints accept in one request
+    max_playlist_items_per_request = 100
     country_codes = [
         "AD",
         "AR",
@@ -137,6 +147,10 @@ class Spotify:
         status_retries=max_retries,
         backoff_factor=0.3,
         language=None,
+        request_listeners=None,
+        session_registry=None,
+        catalog_cache=None,
+        rate_limiter=None,
     ):
         """
         Creates a Spotify API client.
@@ -147,6 +161,7 @@ class Spotify:
             A falsy value disables sessions.
             It should generally be a good idea to keep sessions enabled
             for performance reasons (connection pooling).
+            A session given here is not closed by the client.
         :param client_credentials_manager:
             SpotifyClientCredentials object
         :param oauth_manager:
@@ -172,6 +187,22 @@ class Spotify:
         :param language:
             The language parameter advertises what language the user prefers to see.
             See ISO-639-1 language code: https://en.wikipedia.org/wiki/List_of_ISO_639-1_codes
+        :param request_listeners:
+            A list of callables invoked with a `RequestEvent` after every
+            request, whether it succeeded or not (optional).
+        :param session_registry:
+            A `spotipy.SessionRegistry` providing the session when
+            `requests_session` is truthy but not a session (optional).
+            The session is shared with the auth manager, and with every
+            other client using the same registry.
+        :param catalog_cache:
+            A `spotipy.CatalogCache` answering repeated GET requests to
+            catalog endpoints (albums, artists, tracks...) without
+            sending them (optional). Can be shared by several clients.
+        :param rate_limiter:
+            A `spotipy.RateLimiter` every request waits for before being
+            sent, paused for `Retry-After` seconds whenever a 429 is
+            received (optional). Can be shared by several clients.
         """
         self.prefix = "https://api.spotify.com/v1/"
         self._auth = auth
@@ -185,12 +216,27 @@ class Spotify:
         self.retries = retries
         self.status_retries = status_retries
         self.language = language
+        self.request_listeners = list(request_listeners or [])
+        self.catalog_cache = catalog_cache
+        self.rate_limiter = rate_limiter
 
+        self._owns_session = False
         if isinstance(requests_session, requests.Session):
             self._session = requests_session
+        elif requests_session and session_registry is not None:
+            self._session = session_registry.session(
+                retries=self.retries,
+                status_retries=self.status_retries,
+                backoff_factor=self.backoff_factor,
+                status_forcelist=self.status_forcelist,
+            )
+            use_shared_session = getattr(self.auth_manager, "use_shared_session", None)
+            if use_shared_session is not None:
+                use_shared_session(self._session)
         else:
             if requests_session:  # Build a new session.
                 self._build_session()
+                self._owns_session = True
             else:  # Use the Requests API module as a "session".
                 self._session = requests.api
 
@@ -213,25 +259,18 @@ class Spotify:
     def __del__(self):
         """Make sure the connection (pool) gets closed"""
         try:
-            if isinstance(self._session, requests.Session):
+            if self._owns_session and isinstance(self._session, requests.Session):
                 self._session.close()
         except AttributeError:
             pass
 
     def _build_session(self):
-        self._session = requests.Session()
-        retry = Retry(
-            total=self.retries,
-            connect=None,
-            read=False,
-            allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
-            status=self.status_retries,
-            backoff_factor=self.backoff_factor,
-            status_forcelist=self.status_forcelist)
-
-        adapter = requests.adapters.HTTPAdapter(max_retries=retry)
-        self._session.mount('http://', adapter)
-        self._session.mount('https://', adapter)
+        self._session = build_session(
+            self.retries,
+            self.status_retries,
+            self.backoff_factor,
+            self.status_forcelist,
+        )
 
     def _auth_headers(self):
         if self._auth:
@@ -244,10 +283,50 @@ class Spotify:
             token = self.auth_manager.get_access_token()
         return {"Authorization": f"Bearer {token}"}
 
+    def add_request_listener(self, listener):
+        """ Registers a callable receiving a `RequestEvent` for every request
+
+            Parameters:
+                - listener - a callable taking a single `RequestEvent`
+        """
+        self.request_listeners.append(listener)
+
+    def remove_request_listener(self, listener):
+        """ Unregisters a callable previously added with `add_request_listener`
+
+            Parameters:
+                - listener - the callable to remove
+        """
+        self.request_listeners.remove(listener)
+
+    def _notify_request_listeners(self, event):
+        for listener in self.request_listeners:
+            try:
+                listener(event)
+            except Exception:
+                logger.exception("Request listener %r failed", listener)
+
+    def _pause_rate_limiter(self, headers):
+        try:
+            retry_after = int(headers["Retry-After"])
+        except (KeyError, TypeError, ValueError):
+            retry_after = 30
+        self.rate_limiter.pause(retry_after)
+
     def _internal_call(self, method, url, payload, params):
         args = dict(params=params)
         if not url.startswith("http"):
             url = self.prefix + url
+
+        cache_key = None
+        if self.catalog_cache is not None and url.startswith(self.prefix):
+            path = url[len(self.prefix):]
+            if self.catalog_cache.is_cacheable(method, path):
+                cache_key = self.catalog_cache.key(path, params)
+                results = self.catalog_cache.get(cache_key)
+                if results is not None:
+                    return results
+
         headers = self._auth_headers()
 
         if "content_type" in args["params"]:
@@ -266,16 +345,28 @@ class Spotify:
         logger.debug('Sending %s to %s with Params: %s Headers: %s and Body: %r ',
                      method, url, args.get("params"), headers, args.get('data'))
 
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        status = None
+        started_at = time.time()
+        started = time.perf_counter()
         try:
             response = self._session.request(
                 method, url, headers=headers, proxies=self.proxies,
                 timeout=self.requests_timeout, **args
             )
+            status = response.status_code
 
             response.raise_for_status()
             results = response.json()
+            if cache_key is not None:
+                self.catalog_cache.set(cache_key, response.text)
         except requests.exceptions.HTTPError as http_error:
             response = http_error.response
+            status = response.status_code
+            if status == 429 and self.rate_limiter is not None:
+                self._pause_rate_limiter(response.headers)
             try:
                 json_response = response.json()
                 error = json_response.get("error", {})
@@ -302,6 +393,7 @@ class Spotify:
                 headers=response.headers,
             )
         except requests.exceptions.RetryError as retry_error:
+            status = 429
             request = retry_error.request
             logger.error('Max Retries reached')
             try:
@@ -314,8 +406,20 @@ class Spotify:
                 f"{request.path_url}:\n Max Retries",
                 reason=reason
             )
+        except SpotifyException as spotify_error:
+            # Raised by our Retry class as soon as a rate limit is hit
+            status = spotify_error.http_status
+            if status == 429 and self.rate_limiter is not None:
+                self._pause_rate_limiter(spotify_error.headers)
+            raise
         except ValueError:
             results = None
+        finally:
+            if self.request_listeners:
+                self._notify_request_listeners(RequestEvent(
+                    method, url, status, started_at,
+                    time.perf_counter() - started
+                ))
 
         logger.debug('RESULTS: %s', results)
         return results
@@ -1090,6 +1194,16 @@ class Spotify:
     ):
         """ Adds tracks/episodes to a playlist
 
+            Any number of items can be given: they are sent in chunks of
+            100 (the most the API accepts in one request), one after the
+            other, at consecutive positions so that their order is kept.
+            The response of the last chunk, holding the final snapshot_id,
+            is returned.
+
+            If a chunk fails after others were committed, a
+            SpotifyPartialWriteException telling how many items were added
+            is raised, so that the caller can resume with the rest.
+
             Parameters:
                 - playlist_id - the id of the playlist
                 - items - a list of track/episode URIs or URLs
@@ -1097,11 +1211,35 @@ class Spotify:
         """
         plid = self._get_id("playlist", playlist_id)
         ftracks = [self._get_uri("track", tid) for tid in items]
-        return self._post(
-            f"playlists/{plid}/tracks",
-            payload=ftracks,
-            position=position,
-        )
+        if len(ftracks) <= self.max_playlist_items_per_request:
+            return self._post(
+                f"playlists/{plid}/tracks",
+                payload=ftracks,
+                position=position,
+            )
+
+        result = None
+        committed = 0
+        for start in range(0, len(ftracks), self.max_playlist_items_per_request):
+            chunk = ftracks[start:start + self.max_playlist_items_per_request]
+            try:
+                result = self._post(
+                    f"playlists/{plid}/tracks",
+                    payload=chunk,
+                    position=position + start if position is not None else None,
+                )
+            except SpotifyException as e:
+                raise SpotifyPartialWriteException(
+                    e.http_status,
+                    e.code,
+                    e.msg,
+                    reason=e.reason,
+                    headers=e.headers,
+                    committed=committed,
+                    snapshot_id=result["snapshot_id"] if result else None,
+                ) from e
+            committed += len(chunk)
+        return result
 
     def playlist_replace_items(self, playlist_id, items):
         """ Replace all tracks/episodes in a playlist
@@ -14,3 +14,22 @@ class SpotifyException(Exception):
     def __str__(self):
         return 'http status: {}, code:{} - {}, reason: {}'.format(
             self.http_status, self.code, self.msg, self.reason)
+
+
+class SpotifyPartialWriteException(SpotifyException):
+    """ Raised when a write sent in several requests failed part way
+
+        `committed` is the number of items written before the failing
+        request, and `snapshot_id` the playlist snapshot after them (None
+        when nothing was written).
+    """
+
+    def __init__(self, http_status, code, msg, reason=None, headers=None,
+                 committed=0, snapshot_id=None):
+        super().__init__(http_status, code, msg, reason=reason, headers=headers)
+        self.committed = committed
+        self.snapshot_id = snapshot_id
+
+    def __str__(self):
+        return '{} ({} items committed)'.format(
+            super().__str__(), self.committed)
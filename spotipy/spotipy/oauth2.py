@@ -10,13 +10,13 @@ __all__ = [
 import base64
 import logging
 import os
+import threading
 import time
 import warnings
-import webbrowser
+import weakref
 
 import requests
 import urllib.parse as urllibparse
-from http.server import BaseHTTPRequestHandler, HTTPServer
 from urllib.parse import parse_qsl, urlparse
 
 from spotipy.cache_handler import CacheFileHandler, CacheHandler
@@ -64,17 +64,85 @@ def _ensure_value(value, env_key):
     return _val
 
 
+class _BackgroundTokenRefresher(threading.Thread):
+    """
+    Daemon thread renewing the cached token of an auth manager `margin`
+    seconds before it expires, so that foreground calls to the API never
+    have to wait for a refresh. When a refresh fails, the token is simply
+    left alone and will be refreshed inline as usual.
+    """
+
+    def __init__(self, auth_manager, margin, retry_interval):
+        super().__init__(name="spotipy-token-refresher", daemon=True)
+        # Don't keep the auth manager alive only for this thread
+        self._auth_manager = weakref.ref(auth_manager)
+        self.margin = margin
+        self.retry_interval = retry_interval
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            delay = self._refresh_if_due()
+            if delay is None:
+                return
+            self.stop_event.wait(delay)
+
+    def _refresh_if_due(self):
+        """ Returns the number of seconds to wait before the next check,
+            or None once the auth manager has been garbage collected
+        """
+        auth_manager = self._auth_manager()
+        if auth_manager is None:
+            return None
+
+        token_info = auth_manager.cache_handler.get_cached_token()
+        if not token_info or "refresh_token" not in token_info:
+            return self.retry_interval
+
+        # Tokens living less than twice the margin would otherwise be
+        # refreshed in a loop
+        margin = min(self.margin, token_info.get("expires_in", self.margin * 2) / 2)
+        delay = token_info["expires_at"] - margin - int(time.time())
+        if delay > 0:
+            # The token may be replaced by someone else in the meantime
+            return min(delay, self.retry_interval * 10)
+
+        try:
+            # Reuses the token if another process sharing the cache renewed it
+            auth_manager._refresh_expired_token(token_info)
+        except (SpotifyOauthError, requests.exceptions.RequestException) as e:
+            logger.warning("Background token refresh failed, the token will be "
+                           "refreshed inline when it expires: %s", e)
+            return self.retry_interval
+        return 0
+
+
 class SpotifyAuthBase:
     def __init__(self, requests_session):
+        # Serializes token refreshes, see `_refresh_single_flight`
+        self._refresh_lock = threading.Lock()
+        self._refresh_generation = 0
+        self._refreshed_token_info = None
+        self._owns_session = False
         if isinstance(requests_session, requests.Session):
             self._session = requests_session
         else:
             if requests_session:  # Build a new session.
                 self._session = requests.Session()
+                self._owns_session = True
             else:  # Use the Requests API module as a "session".
                 from requests import api
                 self._session = api
 
+    def use_shared_session(self, session):
+        """ Sends the token requests through `session` (which won't be
+            closed by this auth manager) instead of its own session
+        """
+        if self._owns_session:
+            self._session.close()
+        self._session = session
+        self._owns_session = False
+
     def _normalize_scope(self, scope):
         return normalize_scope(scope)
 
@@ -109,6 +177,63 @@ class SpotifyAuthBase:
         except NameError:
             return input(prompt)
 
+    def _refresh_single_flight(self, refresh, stale_access_token=None):
+        """ Runs `refresh` (which fetches and caches a new token) so that
+            only one refresh is in flight at a time. Threads which waited
+            for a concurrent refresh reuse its result instead of sending
+            their own request.
+
+            Parameters:
+                - refresh - a callable returning the new token_info
+                - stale_access_token - the expired access token the caller
+                  saw, if any. If the cache holds a different valid token,
+                  another thread or process already refreshed it.
+
+            The cache handler's `refresh_lock` is held as well, so that
+            processes sharing a cache also refresh the token only once.
+        """
+        generation = self._refresh_generation
+        with self._refresh_lock, self.cache_handler.refresh_lock():
+            if self._refresh_generation != generation:
+                return self._refreshed_token_info
+
+            if stale_access_token is not None:
+                token_info = self.cache_handler.get_cached_token()
+                if (
+                        token_info
+                        and token_info.get("access_token") != stale_access_token
+                        and not self.is_token_expired(token_info)
+                ):
+                    return token_info
+
+            token_info = refresh()
+            self._refreshed_token_info = token_info
+            self._refresh_generation += 1
+            return token_info
+
+    def start_background_refresh(self, margin=300, retry_interval=30):
+        """ Starts renewing the cached token from a background thread
+
+            Parameters:
+                - margin - how many seconds before expiry the token is renewed.
+                           Should be greater than 60 seconds, the window in
+                           which the token is refreshed inline.
+                - retry_interval - how many seconds to wait after a failed
+                                   refresh or while no token is cached
+        """
+        if getattr(self, "_background_refresher", None) is not None:
+            return
+        self._background_refresher = _BackgroundTokenRefresher(self, margin, retry_interval)
+        self._background_refresher.start()
+
+    def stop_background_refresh(self):
+        """ Stops the thread started by `start_background_refresh` """
+        refresher = getattr(self, "_background_refresher", None)
+        if refresher is None:
+            return
+        refresher.stop_event.set()
+        self._background_refresher = None
+
     @staticmethod
     def is_token_expired(token_info):
         now = int(time.time())
@@ -144,7 +269,8 @@ class SpotifyAuthBase:
 
     def __del__(self):
         """Make sure the connection (pool) gets closed"""
-        if isinstance(self._session, requests.Session):
+        self.stop_background_refresh()
+        if getattr(self, "_owns_session", False) and isinstance(self._session, requests.Session):
             self._session.close()
 
 
@@ -221,15 +347,24 @@ class SpotifyClientCredentials(SpotifyAuthBase):
                 stacklevel=2,
             )
 
+        stale_access_token = None
         if check_cache:
             token_info = self.cache_handler.get_cached_token()
             if token_info and not self.is_token_expired(token_info):
                 return token_info if as_dict else token_info["access_token"]
+            # Any valid token cached while waiting for the lock will do
+            stale_access_token = token_info["access_token"] if token_info else ""
+
+        token_info = self._refresh_single_flight(
+            self._request_and_cache_access_token, stale_access_token
+        )
+        return token_info if as_dict else token_info["access_token"]
 
+    def _request_and_cache_access_token(self):
         token_info = self._request_access_token()
         token_info = self._add_custom_values_to_token_info(token_info)
         self.cache_handler.save_token_to_cache(token_info)
-        return token_info if as_dict else token_info["access_token"]
+        return token_info
 
     def _request_access_token(self):
         """Gets client credentials access token """
@@ -289,7 +424,8 @@ class SpotifyOAuth(SpotifyAuthBase):
             requests_session=True,
             requests_timeout=None,
             open_browser=True,
-            cache_handler=None
+            cache_handler=None,
+            background_refresh=False
     ):
         """
         Creates a SpotifyOAuth object
@@ -316,6 +452,8 @@ class SpotifyOAuth(SpotifyAuthBase):
                               getting and saving cached authorization tokens.
                               Optional, will otherwise use `CacheFileHandler`.
                               (takes precedence over `cache_path` and `username`)
+             * background_refresh: Optional, renew the token from a background thread
+                                   ahead of its expiry (see `start_background_refresh`)
         """
 
         super().__init__(requests_session)
@@ -356,6 +494,8 @@ class SpotifyOAuth(SpotifyAuthBase):
         self.requests_timeout = requests_timeout
         self.show_dialog = show_dialog
         self.open_browser = open_browser
+        if background_refresh:
+            self.start_background_refresh()
 
     def validate_token(self, token_info):
         if token_info is None:
@@ -368,9 +508,7 @@ class SpotifyOAuth(SpotifyAuthBase):
             return None
 
         if self.is_token_expired(token_info):
-            token_info = self.refresh_access_token(
-                token_info["refresh_token"]
-            )
+            token_info = self._refresh_expired_token(token_info)
 
         return token_info
 
@@ -420,6 +558,7 @@ class SpotifyOAuth(SpotifyAuthBase):
         return _make_authorization_headers(self.client_id, self.client_secret)
 
     def _open_auth_url(self):
+        import webbrowser
         auth_url = self.get_authorize_url()
         try:
             webbrowser.open(auth_url)
@@ -515,9 +654,7 @@ class SpotifyOAuth(SpotifyAuthBase):
             token_info = self.validate_token(self.cache_handler.get_cached_token())
             if token_info is not None:
                 if self.is_token_expired(token_info):
-                    token_info = self.refresh_access_token(
-                        token_info["refresh_token"]
-                    )
+                    token_info = self._refresh_expired_token(token_info)
                 return token_info if as_dict else token_info["access_token"]
 
         payload = {
@@ -555,6 +692,18 @@ class SpotifyOAuth(SpotifyAuthBase):
             self._handle_oauth_error(http_error)
 
     def refresh_access_token(self, refresh_token):
+        return self._refresh_single_flight(
+            lambda: self._refresh_access_token(refresh_token)
+        )
+
+    def _refresh_expired_token(self, token_info):
+        refresh_token = token_info["refresh_token"]
+        return self._refresh_single_flight(
+            lambda: self._refresh_access_token(refresh_token),
+            token_info["access_token"],
+        )
+
+    def _refresh_access_token(self, refresh_token):
         payload = {
             "refresh_token": refresh_token,
             "grant_type": "refresh_token",
@@ -641,7 +790,8 @@ class SpotifyPKCE(SpotifyAuthBase):
                  requests_timeout=None,
                  requests_session=True,
                  open_browser=True,
-                 cache_handler=None):
+                 cache_handler=None,
+                 background_refresh=False):
         """
         Creates Auth Manager with the PKCE Auth flow.
 
@@ -665,6 +815,8 @@ class SpotifyPKCE(SpotifyAuthBase):
                               getting and saving cached authorization tokens.
                               Optional, will otherwise use `CacheFileHandler`.
                               (takes precedence over `cache_path` and `username`)
+             * background_refresh: Optional, renew the token from a background thread
+                                   ahead of its expiry (see `start_background_refresh`)
         """
 
         super().__init__(requests_session)
@@ -705,6 +857,8 @@ class SpotifyPKCE(SpotifyAuthBase):
         self.code_challenge = None
         self.authorization_code = None
         self.open_browser = open_browser
+        if background_refresh:
+            self.start_background_refresh()
 
     def _get_code_verifier(self):
         """ Spotify PCKE code verifier - See step 1 of the reference guide below
@@ -752,6 +906,7 @@ class SpotifyPKCE(SpotifyAuthBase):
         return f"{self.OAUTH_AUTHORIZE_URL}?{urlparams}"
 
     def _open_auth_url(self, state=None):
+        import webbrowser
         auth_url = self.get_authorize_url(state)
         try:
             webbrowser.open(auth_url)
@@ -836,9 +991,7 @@ class SpotifyPKCE(SpotifyAuthBase):
             return None
 
         if self.is_token_expired(token_info):
-            token_info = self.refresh_access_token(
-                token_info["refresh_token"]
-            )
+            token_info = self._refresh_expired_token(token_info)
 
         return token_info
 
@@ -871,9 +1024,7 @@ class SpotifyPKCE(SpotifyAuthBase):
             token_info = self.validate_token(self.cache_handler.get_cached_token())
             if token_info is not None:
                 if self.is_token_expired(token_info):
-                    token_info = self.refresh_access_token(
-                        token_info["refresh_token"]
-                    )
+                    token_info = self._refresh_expired_token(token_info)
                 return token_info["access_token"]
 
         if self.code_verifier is None or self.code_challenge is None:
@@ -912,6 +1063,18 @@ class SpotifyPKCE(SpotifyAuthBase):
             self._handle_oauth_error(http_error)
 
     def refresh_access_token(self, refresh_token):
+        return self._refresh_single_flight(
+            lambda: self._refresh_access_token(refresh_token)
+        )
+
+    def _refresh_expired_token(self, token_info):
+        refresh_token = token_info["refresh_token"]
+        return self._refresh_single_flight(
+            lambda: self._refresh_access_token(refresh_token),
+            token_info["access_token"],
+        )
+
+    def _refresh_access_token(self, refresh_token):
         payload = {
             "refresh_token": refresh_token,
             "grant_type": "refresh_token",
@@ -1171,6 +1334,7 @@ class SpotifyImplicitGrant(SpotifyAuthBase):
                                                    "token_type", "expires_in"])
 
     def _open_auth_url(self, state=None):
+        import webbrowser
         auth_url = self.get_authorize_url(state)
         try:
             webbrowser.open(auth_url)
@@ -1238,53 +1402,14 @@ class SpotifyImplicitGrant(SpotifyAuthBase):
         return None
 
 
-class RequestHandler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.server.auth_code = self.server.error = None
-        try:
-            state, auth_code = SpotifyOAuth.parse_auth_response_url(self.path)
-            self.server.state = state
-            self.server.auth_code = auth_code
-        except SpotifyOauthError as error:
-            self.server.error = error
-
-        self.send_response(200)
-        self.send_header("Content-Type", "text/html")
-        self.end_headers()
-
-        if self.server.auth_code:
-            status = "successful"
-        elif self.server.error:
-            status = f"failed ({self.server.error})"
-        else:
-            self._write("<html><body><h1>Invalid request</h1></body></html>")
-            return
+def __getattr__(name):
+    # The local HTTP server machinery is only imported when needed
+    if name == "RequestHandler":
+        from spotipy.auth_server import RequestHandler
+        return RequestHandler
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
-        self._write("""<html>
-<script>
-window.close()
-</script>
-<body>
-<h1>Authentication status: {}</h1>
-This window can be closed.
-<script>
-window.close()
-</script>
-<button class="closeButton" style="cursor: pointer" onclick="window.close();">Close Window</button>
-</body>
-</html>""".format(status))
-
-    def _write(self, text):
-        return self.wfile.write(text.encode("utf-8"))
-
-    def log_message(self, format, *args):
-        return
-
-
-def start_local_http_server(port, handler=RequestHandler):
-    server = HTTPServer(("127.0.0.1", port), handler)
-    server.allow_reuse_address = True
-    server.auth_code = None
-    server.auth_token_form = None
-    server.error = None
-    return server
+def start_local_http_server(port, handler=None):
+    from spotipy.auth_server import start_local_http_server
+    return start_local_http_server(port, handler)
@@ -0,0 +1,243 @@
+""" Diff-based synchronization of playlist items """
+
+__all__ = ["plan_playlist_sync", "sync_playlist"]
+
+import bisect
+from collections import defaultdict
+
+
+def _longest_increasing_subsequence(values):
+    """ Returns the set of values of a longest increasing subsequence """
+    tails = []
+    tails_indexes = []
+    previous = [None] * len(values)
+    for i, value in enumerate(values):
+        j = bisect.bisect_left(tails, value)
+        if j > 0:
+            previous[i] = tails_indexes[j - 1]
+        if j == len(tails):
+            tails.append(value)
+            tails_indexes.append(i)
+        else:
+            tails[j] = value
+            tails_indexes[j] = i
+    result = set()
+    i = tails_indexes[-1] if tails_indexes else None
+    while i is not None:
+        result.add(values[i])
+        i = previous[i]
+    return result
+
+
+def plan_playlist_sync(current, desired, max_items_per_request=None):
+    """ Computes the operations turning the `current` items of a playlist
+        into the `desired` ones
+
+        Items are matched by URI (the n-th occurrence of a URI in `current`
+        with its n-th occurrence in `desired`). The unmatched current items
+        are removed, a longest subsequence of the matched ones already in
+        the desired order stays in place while the others are moved, and
+        the missing items are inserted. Items without a URI (None, e.g.
+        tracks removed from the catalog) can't be handled and are left
+        where they are.
+
+        Parameters:
+            - current - list of the URIs currently in the playlist
+            - desired - list of the URIs the playlist should hold
+            - max_items_per_request - most items removed by one operation
+              (default: Spotify.max_playlist_items_per_request)
+
+        Returns a list of operations, their positions being valid once the
+        previous operations are applied:
+            - ("remove", [(uri, position), ...]) at most
+              max_items_per_request items, from the end of the playlist to
+              its start
+            - ("move", range_start, range_length, insert_before)
+            - ("add", position, [uri, ...])
+    """
+    if max_items_per_request is None:
+        from spotipy.client import Spotify
+
+        max_items_per_request = Spotify.max_playlist_items_per_request
+
+    desired_indexes = defaultdict(list)
+    for i, uri in enumerate(desired):
+        desired_indexes[uri].append(i)
+
+    occurrences = defaultdict(int)
+    removals = []
+    # Items left once the removals are done, as their index in `desired`,
+    # or as ("pinned", position) for items without a URI
+    items = []
+    for position, uri in enumerate(current):
+        if uri is None:
+            items.append(("pinned", position))
+            continue
+        occurrence = occurrences[uri]
+        occurrences[uri] += 1
+        if occurrence < len(desired_indexes[uri]):
+            items.append(desired_indexes[uri][occurrence])
+        else:
+            removals.append((uri, position))
+
+    operations = []
+    removals.reverse()
+    for i in range(0, len(removals), max_items_per_request):
+        operations.append(("remove", removals[i:i + max_items_per_request]))
+
+    kept = [item for item in items if not isinstance(item, tuple)]
+    staying = _longest_increasing_subsequence(kept)
+    kept.sort()
+
+    i = 0
+    while i < len(kept):
+        index = kept[i]
+        if index in staying:
+            i += 1
+            continue
+        # Move along the next items which are contiguous in the playlist
+        range_start = items.index(index)
+        range_length = 1
+        while (
+            i + range_length < len(kept)
+            and kept[i + range_length] not in staying
+            and range_start + range_length < len(items)
+            and items[range_start + range_length] == kept[i + range_length]
+        ):
+            range_length += 1
+        insert_before = items.index(kept[i - 1]) + 1 if i > 0 else 0
+        operations.append(("move", range_start, range_length, insert_before))
+
+        moved = items[range_start:range_start + range_length]
+        del items[range_start:range_start + range_length]
+        if insert_before > range_start:
+            insert_before -= range_length
+        items[insert_before:insert_before] = moved
+        i += range_length
+
+    matched = set(kept)
+    i = 0
+    while i < len(desired):
+        if i in matched:
+            i += 1
+            continue
+        end = i
+        while end < len(desired) and end not in matched:
+            end += 1
+        position = items.index(i - 1) + 1 if i > 0 else 0
+        operations.append(("add", position, list(desired[i:end])))
+        items[position:position] = range(i, end)
+        i = end
+
+    return operations
+
+
+def _playlist_uris(spotify_client, playlist_id):
+    results = spotify_client.playlist_items(
+        playlist_id, fields="items(track(uri)),next"
+    )
+    uris = []
+    while True:
+        for item in results["items"]:
+            track = item.get("track")
+            uris.append(track["uri"] if track else None)
+        if not results.get("next"):
+            return uris
+        results = spotify_client.next(results)
+
+
+def _requests_count(operations, max_items_per_request):
+    """ Number of write requests sending `operations` takes """
+    count = 0
+    for operation in operations:
+        if operation[0] == "add":
+            count += -(-len(operation[2]) // max_items_per_request)
+        else:
+            count += 1
+    return count
+
+
+def _rebuild_playlist(spotify_client, playlist_id, current, uris):
+    """ Replaces the items of a playlist with `uris` """
+    max_items = spotify_client.max_playlist_items_per_request
+    result = spotify_client.playlist_replace_items(playlist_id, uris[:max_items])
+    requests = 1
+    if len(uris) > max_items:
+        result = spotify_client.playlist_add_items(playlist_id, uris[max_items:])
+        requests += -(-(len(uris) - max_items) // max_items)
+    return {
+        "removed": len(current),
+        "moved": 0,
+        "added": len(uris),
+        "requests": requests,
+        "rebuilt": True,
+        "snapshot_id": result["snapshot_id"],
+    }
+
+
+def sync_playlist(spotify_client, playlist_id, uris):
+    """ Makes a playlist hold `uris`, in that order, with as few writes as
+        possible (see `plan_playlist_sync`)
+
+        The playlist is read with a minimal fields projection, then the
+        removals and moves are sent chained on the snapshot_id returned by
+        the previous write. Every scattered insert costs a request: when
+        the plan takes more requests than rewriting the whole playlist, the
+        playlist is replaced instead (which also drops the items without a
+        URI the plan would leave in place).
+
+        Parameters:
+            - spotify_client - a Spotify client
+            - playlist_id - the id of the playlist
+            - uris - the track/episode URIs the playlist should hold
+
+        Returns a dict with the final snapshot_id, the number of items
+        removed, moved and added, and of write requests sent, and whether
+        the playlist was rebuilt.
+    """
+    snapshot_id = spotify_client.playlist(
+        playlist_id, fields="snapshot_id"
+    )["snapshot_id"]
+    current = _playlist_uris(spotify_client, playlist_id)
+    uris = list(uris)
+    max_items = spotify_client.max_playlist_items_per_request
+    operations = plan_playlist_sync(current, uris, max_items)
+    rebuild_requests = max(1, -(-len(uris) // max_items))
+    if _requests_count(operations, max_items) > rebuild_requests:
+        return _rebuild_playlist(spotify_client, playlist_id, current, uris)
+
+    stats = {"removed": 0, "moved": 0, "added": 0, "requests": 0, "rebuilt": False}
+    for operation in operations:
+        if operation[0] == "remove":
+            positions = defaultdict(list)
+            for uri, position in operation[1]:
+                positions[uri].append(position)
+            result = spotify_client.playlist_remove_specific_occurrences_of_items(
+                playlist_id,
+                [{"uri": uri, "positions": p} for uri, p in positions.items()],
+                snapshot_id=snapshot_id,
+            )
+            stats["removed"] += len(operation[1])
+            stats["requests"] += 1
+        elif operation[0] == "move":
+            _, range_start, range_length, insert_before = operation
+            result = spotify_client.playlist_reorder_items(
+                playlist_id,
+                range_start,
+                insert_before,
+                range_length=range_length,
+                snapshot_id=snapshot_id,
+            )
+            stats["moved"] += range_length
+            stats["requests"] += 1
+        else:
+            _, position, added = operation
+            result = spotify_client.playlist_add_items(
+                playlist_id, added, position=position
+            )
+            stats["added"] += len(added)
+            stats["requests"] += -(-len(added) // max_items)
+        snapshot_id = result["snapshot_id"]
+
+    stats["snapshot_id"] = snapshot_id
+    return stats
@@ -0,0 +1,57 @@
+""" Client-side rate limiting shared by Spotify clients """
+
+__all__ = ["RateLimiter"]
+
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every client (and thread) sending requests
+    under the same rate budget.
+
+    Spotify computes its rate limit over a rolling 30 seconds window, so
+    once a 429 is received every client sharing the limiter is paused for
+    the `Retry-After` duration instead of hammering the API.
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        Parameters:
+            * rate: Average number of requests allowed per second
+            * burst: Number of requests which can be sent at once,
+                     defaults to one second worth of requests
+        """
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else max(1, rate))
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self.waited = 0.0
+
+    def acquire(self):
+        """ Blocks until a request can be sent """
+        started = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated_at) * self.rate
+                )
+                self._updated_at = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    self.waited += now - started
+                    return
+                delay = max(
+                    self._paused_until - now, (1 - self._tokens) / self.rate
+                )
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        """ Stops every caller of `acquire` for the next `seconds` """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
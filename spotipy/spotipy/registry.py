@@ -0,0 +1,208 @@
+""" Serving many users from one process """
+
+__all__ = ["ClientRegistry"]
+
+import threading
+import time
+from collections import OrderedDict
+
+from spotipy.catalog_cache import CatalogCache
+from spotipy.client import Spotify
+from spotipy.session import SessionRegistry
+
+
+class UserRequestStats:
+    """ Request listener counting the requests sent on behalf of a user """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.total_time = 0.0
+
+    def __call__(self, event):
+        with self._lock:
+            self.requests += 1
+            self.total_time += event.duration
+            if event.status is None or event.status >= 400:
+                self.errors += 1
+            if event.status == 429:
+                self.rate_limited += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "rate_limited": self.rate_limited,
+                "total_time": self.total_time,
+            }
+
+
+class _Entry:
+    def __init__(self, client, stats):
+        self.client = client
+        self.stats = stats
+        self.last_used_at = time.monotonic()
+
+
+class ClientRegistry:
+    """
+    Hands out one `Spotify` client per user from a bounded LRU.
+
+    Every client shares the same HTTP sessions, catalog cache and rate
+    limiter, while its token state stays isolated in the auth manager
+    (and cache handler) built for its user.
+
+    Example usage::
+
+        def auth_manager_factory(user_id):
+            return SpotifyOAuth(
+                scope=scope,
+                cache_handler=RedisCacheHandler(redis, key=f"token-{user_id}"),
+            )
+
+        registry = ClientRegistry(auth_manager_factory, rate_limiter=RateLimiter(5))
+        sp = registry.client("some-user-id")
+    """
+
+    def __init__(
+        self,
+        auth_manager_factory,
+        max_clients=128,
+        idle_timeout=15 * 60,
+        session_registry=None,
+        catalog_cache=None,
+        rate_limiter=None,
+        **client_kwargs
+    ):
+        """
+        Parameters:
+            * auth_manager_factory: Callable taking a user ID and returning
+                                    the auth manager of that user
+            * max_clients: Number of clients kept, the least recently used
+                           one is evicted first
+            * idle_timeout: Seconds after which an unused client is evicted
+                            by `evict_idle`
+            * session_registry: Optional, a `SessionRegistry` is built otherwise
+            * catalog_cache: Optional, a `CatalogCache` is built otherwise
+            * rate_limiter: Optional `RateLimiter` shared by every client
+            * client_kwargs: Passed to every `Spotify` client
+        """
+        self.auth_manager_factory = auth_manager_factory
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.session_registry = session_registry or SessionRegistry()
+        self.catalog_cache = catalog_cache if catalog_cache is not None else CatalogCache()
+        self.rate_limiter = rate_limiter
+        self.client_kwargs = client_kwargs
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.evictions = 0
+
+    def client(self, user_id):
+        """ Returns the client of `user_id`, building it if needed """
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+                entry.last_used_at = time.monotonic()
+                return entry.client
+
+        # Built outside of the lock, auth manager factories may be slow
+        entry = self._build_entry(user_id)
+        evicted = []
+        with self._lock:
+            existing = self._entries.get(user_id)
+            if existing is not None:
+                self._entries.move_to_end(user_id)
+                existing.last_used_at = time.monotonic()
+                evicted.append(entry)
+                entry = existing
+            else:
+                self._entries[user_id] = entry
+                while len(self._entries) > self.max_clients:
+                    evicted.append(self._entries.popitem(last=False)[1])
+                    self.evictions += 1
+        for old_entry in evicted:
+            self._close_entry(old_entry)
+        return entry.client
+
+    def _build_entry(self, user_id):
+        stats = UserRequestStats()
+        listeners = list(self.client_kwargs.get("request_listeners") or []) + [stats]
+        client_kwargs = dict(self.client_kwargs, request_listeners=listeners)
+        client = Spotify(
+            auth_manager=self.auth_manager_factory(user_id),
+            session_registry=self.session_registry,
+            catalog_cache=self.catalog_cache,
+            rate_limiter=self.rate_limiter,
+            **client_kwargs
+        )
+        return _Entry(client, stats)
+
+    @staticmethod
+    def _close_entry(entry):
+        stop_background_refresh = getattr(
+            entry.client.auth_manager, "stop_background_refresh", None
+        )
+        if stop_background_refresh is not None:
+            stop_background_refresh()
+
+    def evict(self, user_id):
+        with self._lock:
+            entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._close_entry(entry)
+
+    def evict_idle(self):
+        """ Evicts the clients unused for `idle_timeout` seconds and
+            returns how many were evicted
+        """
+        deadline = time.monotonic() - self.idle_timeout
+        with self._lock:
+            idle = [
+                user_id for user_id, entry in self._entries.items()
+                if entry.last_used_at < deadline
+            ]
+            entries = [self._entries.pop(user_id) for user_id in idle]
+            self.evictions += len(entries)
+        for entry in entries:
+            self._close_entry(entry)
+        return len(entries)
+
+    def start_idle_eviction(self, interval=60):
+        """ Calls `evict_idle` every `interval` seconds from a daemon thread,
+            returns an Event stopping it once set
+        """
+        stop_event = threading.Event()
+
+        def evict_periodically():
+            while not stop_event.wait(interval):
+                self.evict_idle()
+
+        threading.Thread(
+            target=evict_periodically, name="spotipy-registry-eviction", daemon=True
+        ).start()
+        return stop_event
+
+    def stats(self):
+        """ Returns the request metrics of every live client, by user ID """
+        with self._lock:
+            entries = list(self._entries.items())
+        return {user_id: entry.stats.as_dict() for user_id, entry in entries}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def close(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            self._close_entry(entry)
+        self.session_registry.close()
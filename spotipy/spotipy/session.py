@@ -0,0 +1,139 @@
+""" Shared HTTP sessions for Spotify clients and auth managers """
+
+__all__ = ["SessionRegistry", "build_session"]
+
+import logging
+import threading
+from types import TracebackType
+
+import requests
+import urllib3
+
+from spotipy.exceptions import SpotifyException
+
+ACCOUNTS_URL = "https://accounts.spotify.com/"
+
+
+class Retry(urllib3.Retry):
+    """
+    Custom class for printing a warning when a rate/request limit is reached.
+    """
+    def increment(
+            self,
+            method: str | None = None,
+            url: str | None = None,
+            response: urllib3.BaseHTTPResponse | None = None,
+            error: Exception | None = None,
+            _pool: urllib3.connectionpool.ConnectionPool | None = None,
+            _stacktrace: TracebackType | None = None,
+    ) -> urllib3.Retry:
+        if response:
+            retry_header = response.headers.get("Retry-After")
+            if self.is_retry(method, response.status, bool(retry_header)):
+                logging.warning("Your application has reached a rate/request limit. "
+                                f"Retry will occur after: {retry_header}")
+                raise SpotifyException(429, -1, "rate limit reached", headers=response.headers)
+        return super().increment(method,
+                                 url,
+                                 response=response,
+                                 error=error,
+                                 _pool=_pool,
+                                 _stacktrace=_stacktrace)
+
+
+def build_session(
+    retries,
+    status_retries,
+    backoff_factor,
+    status_forcelist,
+    pool_connections=10,
+    pool_maxsize=10,
+):
+    """ Builds a requests Session retrying failed Web API calls
+
+        Requests to the accounts service (token requests of the auth
+        managers) go through a separate adapter without retries, so that
+        their errors are reported as they used to be.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(['GET', 'POST', 'PUT', 'DELETE']),
+        status=status_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=status_forcelist)
+
+    adapter = requests.adapters.HTTPAdapter(
+        max_retries=retry,
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.mount(ACCOUNTS_URL, requests.adapters.HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+    ))
+    return session
+
+
+class SessionRegistry:
+    """
+    Hands out requests Sessions shared by every Spotify client and auth
+    manager of a process, so that they reuse the same connection pools
+    (and TLS connections) to api.spotify.com and accounts.spotify.com.
+
+    Example usage::
+
+        registry = SessionRegistry(pool_maxsize=32)
+        for user in users:
+            auth_manager = SpotifyOAuth(..., requests_session=registry.session())
+            sp = Spotify(auth_manager=auth_manager, session_registry=registry)
+
+    Clients and auth managers never close a shared session, call `close`
+    once they are all done.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10):
+        """
+        Parameters:
+            * pool_connections: Number of hosts to keep connection pools for
+            * pool_maxsize: Maximum number of connections kept per host,
+                            should be at least the number of concurrent workers
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def session(
+        self,
+        retries=3,
+        status_retries=3,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+    ):
+        """ Returns the session shared by all callers using the same retry
+            configuration (the defaults match the ones of `Spotify`)
+        """
+        key = (retries, status_retries, backoff_factor, tuple(status_forcelist))
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = build_session(
+                    retries,
+                    status_retries,
+                    backoff_factor,
+                    status_forcelist,
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                )
+            return session
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
@@ -5,12 +5,9 @@ __all__ = ["CLIENT_CREDS_ENV_VARS", "prompt_for_user_token"]
 import logging
 import os
 import warnings
-from types import TracebackType
 
 import spotipy
 
-import urllib3
-
 LOGGER = logging.getLogger(__name__)
 
 CLIENT_CREDS_ENV_VARS = {
@@ -135,28 +132,11 @@ def normalize_scope(scope):
     else:
         return None
 
-class Retry(urllib3.Retry):
-    """
-    Custom class for printing a warning when a rate/request limit is reached.
-    """
-    def increment(
-            self,
-            method: str | None = None,
-            url: str | None = None,
-            response: urllib3.BaseHTTPResponse | None = None,
-            error: Exception | None = None,
-            _pool: urllib3.connectionpool.ConnectionPool | None = None,
-            _stacktrace: TracebackType | None = None,
-    ) -> urllib3.Retry:
-        if response:
-            retry_header = response.headers.get("Retry-After")
-            if self.is_retry(method, response.status, bool(retry_header)):
-                logging.warning("Your application has reached a rate/request limit. "
-                                f"Retry will occur after: {retry_header}")
-                raise spotipy.SpotifyException(429, -1, "rate limit reached", headers=response.headers)
-        return super().increment(method,
-                                 url,
-                                 response=response,
-                                 error=error,
-                                 _pool=_pool,
-                                 _stacktrace=_stacktrace)
\ No newline at end of file
+
+def __getattr__(name):
+    # Kept here for backward compatibility, without importing urllib3
+    # for the users of the helpers above
+    if name == "Retry":
+        from spotipy.session import Retry
+        return Retry
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
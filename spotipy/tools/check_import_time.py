@@ -0,0 +1,88 @@
+""" Import-time budget check for the spotipy package
+
+    Runs `python -X importtime` in a fresh interpreter for a few typical
+    import statements, and exits with a non-zero status if one of them
+    exceeds its budget or imports an optional backend eagerly.
+
+    Usage: python tools/check_import_time.py [--scale 2.0]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# statement, budget in milliseconds (cumulative import time of spotipy.*)
+BUDGETS = [
+    ("import spotipy", 10),
+    ("from spotipy import Spotify, SpotifyOAuth, CacheFileHandler", 250),
+]
+
+# Optional backends which must only be imported when actually used
+LAZY_MODULES = ["redis", "pymemcache", "http.server", "webbrowser", "spotipy.auth_server"]
+
+_line = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(statement):
+    """ Returns the cumulative import time (in microseconds) of every module
+        imported at the top level by `statement`, by module name
+    """
+    env = dict(os.environ, PYTHONPATH=PACKAGE_DIR)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = _line.match(line)
+        if match is None:
+            continue
+        _, cumulative, indent, name = match.groups()
+        modules[name] = (int(cumulative), len(indent))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scale",
+        type=float,
+        default=1.0,
+        help="multiply every budget, e.g. on slow CI machines",
+    )
+    args = parser.parse_args()
+
+    # Modules imported by the interpreter startup itself (site, ...)
+    startup = measure("pass")
+
+    failed = False
+    for statement, budget_ms in BUDGETS:
+        modules = measure(statement)
+        # Only count top-level imports, their children are already included
+        spent_us = sum(
+            cumulative for name, (cumulative, depth) in modules.items()
+            if depth == 1 and name not in startup
+        )
+        budget_us = budget_ms * args.scale * 1000
+        status = "ok" if spent_us <= budget_us else "OVER BUDGET"
+        print(f"{statement!r}: {spent_us / 1000:.1f} ms "
+              f"(budget {budget_us / 1000:.0f} ms) {status}")
+        failed |= spent_us > budget_us
+
+        eager = [name for name in LAZY_MODULES if name in modules]
+        if eager:
+            print(f"    imports optional modules eagerly: {', '.join(eager)}")
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,232 @@
+""" Behaviour check for RedisNearCacheHandler
+
+    Runs against fakeredis (or a real server with --url) and exits with a
+    non-zero status if one of these fails:
+
+    - near cache: repeated lookups of a valid token don't hit Redis, a token
+      about to expire is read from Redis again
+    - pub/sub and keyspace invalidation: a token saved by one handler
+      replaces the local copy of another handler sharing the key, while
+      the handler's own saves keep its local copy
+    - refresh_lock: without distributed_lock it's a no-op, with it two
+      handlers (two nodes) never hold it at once
+
+    redis-py's Lock releases itself with a Lua script (EVALSHA), which plain
+    fakeredis doesn't implement: the distributed_lock=True check is skipped
+    unless fakeredis can run Lua (`pip install fakeredis[lua]`) or --url
+    points to a real server.
+
+    Usage: python tools/check_redis_near_cache.py [--url redis://localhost:6379/15]
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+from spotipy.cache_handler import RedisNearCacheHandler  # noqa: E402
+
+
+class CountingRedis:
+    """ Redis client counting the GET commands it sends """
+
+    def __init__(self, redis):
+        self._redis = redis
+        self.gets = 0
+
+    def get(self, *args, **kwargs):
+        self.gets += 1
+        return self._redis.get(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._redis, name)
+
+
+def make_client_factory(url):
+    """ Returns a function building Redis clients of the same server """
+    if url is not None:
+        import redis
+        return lambda: redis.Redis.from_url(url)
+    import fakeredis
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.FakeRedis(server=server)
+
+
+def token(access_token, expires_in=3600):
+    return {
+        "access_token": access_token,
+        "expires_in": expires_in,
+        "expires_at": int(time.time()) + expires_in,
+    }
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def check_near_cache(new_client, key):
+    redis = CountingRedis(new_client())
+    handler = RedisNearCacheHandler(redis=redis, key=key)
+    redis.set(key, json.dumps(token("a")))
+    for _ in range(100):
+        handler.get_cached_token()
+    if redis.gets != 1:
+        return f"100 lookups of a valid token sent {redis.gets} GETs, expected 1"
+
+    # Within near_cache_margin of its expiry the local copy isn't used
+    redis.set(key, json.dumps(token("b", expires_in=30)))
+    handler.invalidate()
+    redis.gets = 0
+    for _ in range(3):
+        handler.get_cached_token()
+    if redis.gets != 3:
+        return f"3 lookups of an expiring token sent {redis.gets} GETs, expected 3"
+    return None
+
+
+def check_invalidation(new_client, key):
+    first = RedisNearCacheHandler(redis=new_client(), key=key, invalidation="pubsub")
+    second = RedisNearCacheHandler(redis=new_client(), key=key, invalidation="pubsub")
+    try:
+        first.save_token_to_cache(token("a"))
+        if (second.get_cached_token() or {}).get("access_token") != "a":
+            return "the second handler doesn't see the token saved by the first one"
+        first.save_token_to_cache(token("b"))
+        if not wait_for(lambda: second.get_cached_token()["access_token"] == "b"):
+            return "the second handler kept its local copy after an invalidation"
+        if first.get_cached_token()["access_token"] != "b":
+            return "a handler dropped the token it saved itself"
+    finally:
+        first.close()
+        second.close()
+    return None
+
+
+def check_keyspace_invalidation(new_client, key):
+    from redis import ResponseError
+
+    redis = new_client()
+    try:
+        previous = redis.config_get("notify-keyspace-events")["notify-keyspace-events"]
+    except ResponseError:
+        # fakeredis has no CONFIG GET, there is nothing to restore anyway
+        previous = None
+    redis.config_set("notify-keyspace-events", "K$")
+    counting = CountingRedis(new_client())
+    first = RedisNearCacheHandler(redis=counting, key=key, invalidation="keyspace")
+    second = RedisNearCacheHandler(redis=new_client(), key=key, invalidation="keyspace")
+    try:
+        first.save_token_to_cache(token("a"))
+        # Leaves time for the notification of the save to arrive
+        time.sleep(0.5)
+        if first.get_cached_token()["access_token"] != "a" or counting.gets != 0:
+            return "a handler dropped its local copy after its own save"
+        second.save_token_to_cache(token("b"))
+        if not wait_for(lambda: first.get_cached_token()["access_token"] == "b"):
+            return "the first handler kept its local copy after another handler's save"
+    finally:
+        first.close()
+        second.close()
+        if previous is not None:
+            redis.config_set("notify-keyspace-events", previous)
+    return None
+
+
+def check_refresh_lock(new_client, key):
+    handler = RedisNearCacheHandler(redis=new_client(), key=key)
+    with handler.refresh_lock():
+        with handler.refresh_lock():
+            pass
+    if new_client().exists(key + ":lock"):
+        return "refresh_lock took a Redis lock without distributed_lock"
+    return None
+
+
+def check_distributed_lock(new_client, key):
+    """ Returns an error message, or None. Raises the ResponseError of
+        servers which can't run Lua scripts
+    """
+    handlers = [
+        RedisNearCacheHandler(redis=new_client(), key=key, distributed_lock=True)
+        for _ in range(2)
+    ]
+    holders = []
+    overlaps = []
+    errors = []
+
+    def refresh(handler):
+        try:
+            for _ in range(5):
+                with handler.refresh_lock():
+                    holders.append(handler)
+                    if len(holders) > 1:
+                        overlaps.append(len(holders))
+                    time.sleep(0.01)
+                    holders.remove(handler)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=refresh, args=(h,)) for h in handlers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    if overlaps:
+        return "two handlers held the distributed refresh lock at once"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--url", help="Redis server to use instead of fakeredis (keys are removed after)"
+    )
+    args = parser.parse_args()
+
+    from redis import ResponseError
+
+    new_client = make_client_factory(args.url)
+    key = f"spotipy-check-{uuid.uuid4().hex}"
+    checks = [
+        ("near cache", check_near_cache),
+        ("pub/sub invalidation", check_invalidation),
+        ("keyspace invalidation", check_keyspace_invalidation),
+        ("refresh_lock", check_refresh_lock),
+        ("distributed refresh_lock", check_distributed_lock),
+    ]
+
+    failed = False
+    try:
+        for name, check in checks:
+            try:
+                error = check(new_client, key)
+            except ResponseError as response_error:
+                if "evalsha" not in str(response_error).lower():
+                    raise
+                print(f"{name}: skipped, the server can't run Lua scripts "
+                      f"(install fakeredis[lua] or use --url)")
+                continue
+            print(f"{name}: {'ok' if error is None else 'FAILED, ' + error}")
+            failed |= error is not None
+            new_client().delete(key, key + ":lock")
+    finally:
+        new_client().delete(key, key + ":lock")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,192 @@
+""" Token refresh stress check for the auth managers
+
+    Starts a local token endpoint, then makes many threads ask the same
+    auth manager for a token at once while the cached one is expired (or,
+    for client credentials, missing). Exits with a non-zero status if an
+    auth manager sent more than one POST to the token endpoint, or if the
+    threads didn't all get the same token.
+
+    Usage: python tools/stress_token_refresh.py [--threads 64] [--delay 0.2]
+                                                [--shared-cache]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PACKAGE_DIR)
+
+from spotipy.cache_handler import MemoryCacheHandler, SharedCacheFileHandler  # noqa: E402
+from spotipy.oauth2 import (  # noqa: E402
+    SpotifyClientCredentials,
+    SpotifyOAuth,
+    SpotifyPKCE,
+)
+
+SCOPE = "playlist-modify-private"
+
+
+class TokenEndpoint(BaseHTTPRequestHandler):
+    """ Answers every POST with a new token after `delay` seconds """
+
+    delay = 0.2
+    posts = 0
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with TokenEndpoint._lock:
+            TokenEndpoint.posts += 1
+            count = TokenEndpoint.posts
+        # Keeps the refresh in flight while the other threads ask for a token
+        time.sleep(self.delay)
+        body = json.dumps({
+            "access_token": f"token-{count}",
+            "token_type": "Bearer",
+            "expires_in": 3600,
+            "refresh_token": "refresh-token",
+            "scope": SCOPE,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TokenServer(ThreadingHTTPServer):
+    # Room for every thread to connect at once
+    request_queue_size = 256
+
+
+def expired_token():
+    return {
+        "access_token": "expired",
+        "token_type": "Bearer",
+        "expires_in": 3600,
+        "expires_at": int(time.time()) - 60,
+        "refresh_token": "refresh-token",
+        "scope": SCOPE,
+    }
+
+
+def make_cache_handler(name, token_info, directory):
+    if directory is None:
+        return MemoryCacheHandler(token_info)
+    cache_handler = SharedCacheFileHandler(cache_path=os.path.join(directory, name))
+    if token_info is not None:
+        cache_handler.save_token_to_cache(token_info)
+    return cache_handler
+
+
+def make_auth_managers(token_url, directory):
+    """ Auth managers by name, their cache holding an expired token (none
+        for client credentials, which get a new token instead)
+    """
+    auth_managers = {
+        "SpotifyOAuth": SpotifyOAuth(
+            client_id="client-id",
+            client_secret="client-secret",
+            redirect_uri="http://127.0.0.1:8080",
+            scope=SCOPE,
+            cache_handler=make_cache_handler("oauth", expired_token(), directory),
+        ),
+        "SpotifyPKCE": SpotifyPKCE(
+            client_id="client-id",
+            redirect_uri="http://127.0.0.1:8080",
+            scope=SCOPE,
+            cache_handler=make_cache_handler("pkce", expired_token(), directory),
+        ),
+        "SpotifyClientCredentials": SpotifyClientCredentials(
+            client_id="client-id",
+            client_secret="client-secret",
+            cache_handler=make_cache_handler("client_credentials", None, directory),
+        ),
+    }
+    for auth_manager in auth_managers.values():
+        auth_manager.OAUTH_TOKEN_URL = token_url
+    return auth_managers
+
+
+def get_token(auth_manager):
+    if isinstance(auth_manager, SpotifyPKCE):
+        return auth_manager.get_access_token()
+    return auth_manager.get_access_token(as_dict=False)
+
+
+def stress(auth_manager, threads):
+    """ Returns the tokens the threads got and the errors they raised """
+    barrier = threading.Barrier(threads)
+    tokens = []
+    errors = []
+
+    def run():
+        barrier.wait()
+        try:
+            tokens.append(get_token(auth_manager))
+        except Exception as error:
+            errors.append(error)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return tokens, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--threads", type=int, default=64, help="threads asking for a token (default: 64)"
+    )
+    parser.add_argument(
+        "--delay",
+        type=float,
+        default=0.2,
+        help="seconds the token endpoint takes to answer (default: 0.2)",
+    )
+    parser.add_argument(
+        "--shared-cache",
+        action="store_true",
+        help="cache the tokens with SharedCacheFileHandler instead of in memory",
+    )
+    args = parser.parse_args()
+
+    TokenEndpoint.delay = args.delay
+    server = TokenServer(("127.0.0.1", 0), TokenEndpoint)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    token_url = f"http://127.0.0.1:{server.server_port}/api/token"
+
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        auth_managers = make_auth_managers(
+            token_url, directory if args.shared_cache else None
+        )
+        for name, auth_manager in auth_managers.items():
+            posts_before = TokenEndpoint.posts
+            tokens, errors = stress(auth_manager, args.threads)
+            posts = TokenEndpoint.posts - posts_before
+            ok = posts == 1 and not errors and len(set(tokens)) == 1
+            print(f"{name}: {posts} POST(s) for {args.threads} threads, "
+                  f"{len(set(tokens))} distinct token(s), {len(errors)} error(s) "
+                  f"{'ok' if ok else 'FAILED'}")
+            for error in errors[:3]:
+                print(f"    {error!r}")
+            failed |= not ok
+    server.shutdown()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())